@@ -1,15 +1,92 @@
 from flask import Flask, render_template, request, jsonify
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import plotly.utils
+import os
 import json
-from io import StringIO
+import codecs
+import hashlib
+import functools
+import threading
+import time
+import uuid
+import shutil
+import zipfile
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from io import TextIOWrapper
 import datetime
 from datetime import timedelta
+from pandas.api.types import union_categoricals
+from ledger import OccurrenceCounter, TransactionLedger
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    # The pandas C parser is used when pyarrow is not installed
+    pa = None
 
 app = Flask(__name__)
 
+# Every upload is appended to a persistent, deduplicated ledger that dashboards query by date window
+ledger = TransactionLedger(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ledger.db'))
+DEFAULT_WINDOW_DAYS = 365
+REQUIRED_COLUMNS = ['Date', 'Investment', 'Transaction Type', 'Amount ($)']
+
+# Bytes inspected to pick the upload's encoding, and rows (C parser) or bytes (pyarrow) parsed per chunk
+ENCODING_SNIFF_BYTES = 64 * 1024
+CSV_CHUNK_ROWS = 50_000
+CSV_BLOCK_BYTES = 4 * 1024 * 1024
+
+# Column types declared at read time; amounts stay strings until their thousands separators are stripped
+DATE_FORMAT = '%m/%d/%Y'
+CATEGORY_COLUMNS = ['Investment', 'Transaction Type']
+NUMERIC_COLUMNS = ['Amount ($)', 'Shares/Unit']
+if pa is not None:
+    ARROW_COLUMN_TYPES = {
+        'Date': pa.string(),
+        'Investment': pa.dictionary(pa.int32(), pa.string()),
+        'Transaction Type': pa.dictionary(pa.int32(), pa.string()),
+        'Amount ($)': pa.string(),
+        'Shares/Unit': pa.string(),
+    }
+
+# Processed uploads kept in memory for the paginated transaction table
+TABLE_COLUMNS = ['Date', 'Investment', 'Transaction Type', 'Shares/Unit', 'Amount ($)']
+MAX_DATASETS = 8
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+datasets = OrderedDict()
+datasets_lock = threading.Lock()
+
+# On-disk cache of upload results keyed by a hash of the raw file bytes.
+# Bump CACHE_VERSION whenever processing or chart output changes.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+CACHE_VERSION = 3
+MAX_CACHE_ENTRIES = 20
+HASH_BLOCK_BYTES = 1024 * 1024
+
+# Cumulative chart resolutions as pandas period frequencies; 'auto' picks the finest one within MAX_LINE_POINTS
+LINE_RESOLUTIONS = {'daily': 'D', 'weekly': 'W', 'monthly': 'M'}
+MAX_LINE_POINTS = 400
+
+# Uploads are spooled to disk and processed on a small worker pool; /jobs/<id> reports progress
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+JOB_WORKERS = 2
+MAX_JOBS = 100
+job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='upload-job')
+jobs = OrderedDict()
+jobs_lock = threading.Lock()
+
+# Multi-file and zip uploads are parsed one statement per worker process
+PARSE_WORKERS = min(os.cpu_count() or 1, 4)
+parse_pool = None
+parse_pool_lock = threading.Lock()
+
 # Defining numerical abbreviation function
 def abbreviate_number(num):
     if abs(num) >= 1_000_000:
@@ -18,45 +95,214 @@ def abbreviate_number(num):
         return f"{num/1_000:.2f}K"
     return f"{num:.2f}"
 
-# Processing and cleaning data
-def process_data(csv_content):
+# Detecting the upload encoding from a small prefix of the stream
+def detect_encoding(stream):
+    prefix = stream.read(ENCODING_SNIFF_BYTES)
+    stream.seek(0)
+    if prefix.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
     try:
-        df = pd.read_csv(StringIO(csv_content), thousands=',')
-        
-        # Try to parse dates - handle different date formats
-        if 'Date' in df.columns:
-            df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        
-        # Drop rows with missing essential data
-        required_columns = ['Date', 'Investment', 'Transaction Type', 'Amount ($)']
-        existing_columns = [col for col in required_columns if col in df.columns]
-        df = df.dropna(subset=existing_columns)
-        
-        # Converting numerical columns
-        if 'Amount ($)' in df.columns:
-            df['Amount ($)'] = pd.to_numeric(df['Amount ($)'], errors='coerce')
-        if 'Shares/Unit' in df.columns:
-            df['Shares/Unit'] = pd.to_numeric(df['Shares/Unit'], errors='coerce')
-        
-        # Filtering data for the last year (only if Date column exists and has valid dates)
-        if 'Date' in df.columns and not df['Date'].isna().all():
-            end_date = pd.to_datetime('2025-07-17')
-            start_date = end_date - timedelta(days=365)
-            df = df[(df['Date'] >= start_date) & (df['Date'] <= end_date)]
-        
-        return df
+        # Incremental decode so a multi-byte character cut at the prefix edge is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+# pyarrow decodes strictly; these codecs let it replace a stray bad byte like the C parser path does
+def search_replace_codecs(name):
+    if name in ('utf8_replace', 'utf8_sig_replace'):
+        base = codecs.lookup('utf-8-sig' if name == 'utf8_sig_replace' else 'utf-8')
+        return codecs.CodecInfo(
+            base.encode, base.decode, name=name,
+            incrementalencoder=base.incrementalencoder,
+            incrementaldecoder=functools.partial(base.incrementaldecoder, errors='replace')
+        )
+    return None
+
+codecs.register(search_replace_codecs)
+
+# Cleaning one parsed chunk; the date window is applied when reading from the ledger
+def clean_chunk(df):
+    # Statement dates are MM/DD/YYYY; anything else falls back to format inference
+    if 'Date' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        dates = pd.to_datetime(df['Date'], format=DATE_FORMAT, errors='coerce')
+        if dates.isna().all() and df['Date'].notna().any():
+            dates = pd.to_datetime(df['Date'], errors='coerce')
+        df['Date'] = dates
+    
+    # Drop rows with missing essential data
+    existing_columns = [col for col in REQUIRED_COLUMNS if col in df.columns]
+    df = df.dropna(subset=existing_columns)
+    
+    # Converting numerical columns in one pass each, stripping thousands separators left as text
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '', regex=False), errors='coerce')
+    
+    # Low-cardinality names as categoricals for cheap groupbys and small memory
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    
+    return df
+
+# Reading raw chunks with the multithreaded pyarrow parser and declared column types
+def read_arrow_chunks(stream, encoding):
+    arrow_encoding = {'utf-8': 'utf8_replace', 'utf-8-sig': 'utf8_sig_replace'}.get(encoding, encoding)
+    reader = pa_csv.open_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES, encoding=arrow_encoding),
+        convert_options=pa_csv.ConvertOptions(column_types=ARROW_COLUMN_TYPES, strings_can_be_null=True)
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+# Reading raw chunks with the pandas C parser
+def read_c_chunks(stream, encoding):
+    # errors='replace' keeps a stray bad byte past the sniffed prefix from failing the upload
+    text = TextIOWrapper(stream, encoding=encoding, errors='replace', newline='')
+    try:
+        yield from pd.read_csv(
+            text, thousands=',', chunksize=CSV_CHUNK_ROWS,
+            dtype={col: 'category' for col in CATEGORY_COLUMNS}
+        )
+    finally:
+        # Hand the underlying stream back to the caller open
+        text.detach()
+
+# Parsing the upload stream chunk by chunk, yielding each cleaned chunk
+def iter_clean_chunks(stream, engine=None):
+    encoding = detect_encoding(stream)
+    use_arrow = pa is not None and engine != 'c'
+    chunks = read_arrow_chunks(stream, encoding) if use_arrow else read_c_chunks(stream, encoding)
+    for chunk in chunks:
+        yield clean_chunk(chunk)
+
+# Concatenating chunks; categories differ chunk to chunk, so unify them to keep the columns categorical
+def concat_chunks(chunks):
+    for col in CATEGORY_COLUMNS:
+        if all(col in chunk.columns for chunk in chunks):
+            categories = union_categoricals([chunk[col] for chunk in chunks]).categories
+            for chunk in chunks:
+                chunk[col] = chunk[col].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+# Processing and cleaning data straight from the upload stream, one chunk at a time
+def process_data(stream, engine=None):
+    try:
+        chunks = list(iter_clean_chunks(stream, engine))
+        if not chunks:
+            return pd.DataFrame()
+        return concat_chunks(chunks)
     except Exception as e:
         print(f"Error processing data: {e}")
         return pd.DataFrame()
 
-# Generating summary metrics
-def generate_summary(df):
+# Appending an upload to the ledger chunk by chunk; returns (rows parsed, rows added)
+def ingest_upload(stream, timings=None):
+    timings = {} if timings is None else timings
+    parsed = added = 0
+    parse_seconds = 0.0
+    occurrences = OccurrenceCounter()
+    chunks = iter_clean_chunks(stream)
+    while True:
+        # Parsing and appending interleave, so only the time spent pulling chunks counts as parsing
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        parse_seconds += time.perf_counter() - started
+        if chunk is None:
+            break
+        missing = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+        parsed += len(chunk)
+        added += ledger.add_transactions(chunk, occurrences)
+    timings['parse'] = parse_seconds
+    return parsed, added
+
+# Parsing one statement file in a worker process
+def parse_statement(path):
+    with open(path, 'rb') as stream:
+        return process_data(stream)
+
+# Started on first use; spawned workers so forking never copies the job threads' locks
+def get_parse_pool():
+    global parse_pool
+    with parse_pool_lock:
+        if parse_pool is None:
+            parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return parse_pool
+
+# Parsing several statements in parallel, then appending each to the ledger; returns (rows parsed, rows added)
+def ingest_statements(statements, timings=None):
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+    frames = list(get_parse_pool().map(parse_statement, [path for _, path in statements]))
+    timings['parse'] = time.perf_counter() - started
+    for (name, _), df in zip(statements, frames):
+        if len(df.columns) == 0:
+            raise ValueError(f"Could not parse {name}")
+        missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"{name}: Missing required columns: {', '.join(missing)}")
+    
+    # One statement per call: repeated rows are numbered within their own statement,
+    # so statements that overlap each other still dedupe
+    parsed = added = 0
+    for df in frames:
+        if not df.empty:
+            parsed += len(df)
+            added += ledger.add_transactions(df)
+    return parsed, added
+
+# Pulling the CSV members out of a zip into standalone files; returns [(name, path)]
+def extract_statements(name, zip_path):
+    statements = []
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for member in archive.infolist():
+                member_name = os.path.basename(member.filename)
+                if member.is_dir() or not member_name.lower().endswith('.csv') or member_name.startswith('._'):
+                    continue
+                # Members get generated names so paths inside the archive can't escape UPLOAD_DIR
+                path = os.path.join(UPLOAD_DIR, f'{uuid.uuid4().hex}.csv')
+                with archive.open(member) as source, open(path, 'wb') as target:
+                    shutil.copyfileobj(source, target, HASH_BLOCK_BYTES)
+                statements.append((f'{name}/{member.filename}', path))
+    except zipfile.BadZipFile:
+        raise ValueError(f"{name} is not a valid zip file")
+    return statements
+
+# Resolving the dashboard window; defaults to the year ending at the latest ledger transaction
+def resolve_window(start_date=None, end_date=None):
+    if not end_date:
+        end_date = ledger.get_date_range()[1]
+        if end_date is None:
+            return None, None
+    if not start_date:
+        start_date = (pd.to_datetime(end_date) - timedelta(days=DEFAULT_WINDOW_DAYS)).strftime('%Y-%m-%d')
+    return start_date, end_date
+
+# Aggregating once into an Investment x Transaction Type x day cube shared by the summary and charts
+def build_cube(df):
     if df.empty:
+        return pd.DataFrame(columns=['Investment', 'Transaction Type', 'Date', 'Amount ($)'])
+    
+    day = df['Date'].dt.normalize()
+    return (
+        df.groupby(['Investment', 'Transaction Type', day], sort=True, observed=True)['Amount ($)']
+        .sum()
+        .reset_index()
+    )
+
+# Generating summary metrics
+def generate_summary(cube):
+    if cube.empty:
         return {"investments": [], "net_change": "0.00"}
     
     try:
-        summary = df.groupby(['Investment', 'Transaction Type'])['Amount ($)'].sum().unstack().fillna(0)
-        total_net = df['Amount ($)'].sum()
+        summary = cube.groupby(['Investment', 'Transaction Type'], observed=True)['Amount ($)'].sum().unstack().fillna(0)
+        total_net = cube['Amount ($)'].sum()
         
         summary_data = []
         for investment in summary.index:
@@ -81,12 +327,12 @@ def generate_summary(df):
         return {"investments": [], "net_change": "0.00"}
 
 # Creating bar chart for transaction types
-def create_bar_chart(df):
-    if df.empty:
+def create_bar_chart(cube):
+    if cube.empty:
         return None
     
     try:
-        summary = df.groupby(['Investment', 'Transaction Type'])['Amount ($)'].sum().reset_index()
+        summary = cube.groupby(['Investment', 'Transaction Type'], observed=True)['Amount ($)'].sum().reset_index()
         fig = px.bar(
             summary,
             x='Investment',
@@ -102,19 +348,41 @@ def create_bar_chart(df):
         print(f"Error creating bar chart: {e}")
         return None
 
+# Picking the finest resolution that keeps a series spanning first..last within MAX_LINE_POINTS
+def pick_resolution(first, last, resolution='auto'):
+    if resolution != 'auto':
+        return resolution
+    span_days = (last - first).days + 1
+    return 'daily' if span_days <= MAX_LINE_POINTS else 'weekly' if span_days <= MAX_LINE_POINTS * 7 else 'monthly'
+
+# Last day of each period; the current one ends at the latest transaction, not in the future
+def period_ends(periods, last):
+    return np.minimum(periods.to_timestamp(how='end').normalize(), last)
+
+# Bucketing daily net amounts and accumulating them; each point sits at its bucket's last day
+def resample_cumulative(daily, resolution='auto'):
+    resolution = pick_resolution(daily.index[0], daily.index[-1], resolution)
+    periods = daily.index.to_period(LINE_RESOLUTIONS[resolution])
+    buckets = daily.groupby(periods).sum()
+    cumulative = pd.DataFrame({
+        'Date': period_ends(buckets.index, daily.index[-1]),
+        'Cumulative Value': buckets.cumsum().to_numpy()
+    })
+    return cumulative, resolution
+
 # Creating line chart for cumulative value
-def create_line_chart(df):
-    if df.empty:
+def create_line_chart(cube, resolution='auto'):
+    if cube.empty:
         return None
     
     try:
-        df_sorted = df.sort_values('Date')
-        df_sorted['Cumulative Value'] = df_sorted['Amount ($)'].cumsum()
+        daily = cube.groupby(cube['Date'].dt.normalize())['Amount ($)'].sum()
+        cumulative, resolution = resample_cumulative(daily, resolution)
         fig = px.line(
-            df_sorted,
+            cumulative,
             x='Date',
             y='Cumulative Value',
-            title='Cumulative Account Value Over Time',
+            title=f'Cumulative Account Value Over Time ({resolution.capitalize()})',
             labels={'Cumulative Value': 'Cumulative Value ($)'}
         )
         fig.update_layout(font_size=12)
@@ -124,12 +392,12 @@ def create_line_chart(df):
         return None
 
 # Creating pie chart for investment allocation
-def create_pie_chart(df):
-    if df.empty:
+def create_pie_chart(cube):
+    if cube.empty:
         return None
     
     try:
-        total_by_investment = df.groupby('Investment')['Amount ($)'].sum().reset_index()
+        total_by_investment = cube.groupby('Investment', observed=True)['Amount ($)'].sum().reset_index()
         total_by_investment = total_by_investment[total_by_investment['Amount ($)'] > 0]
         if total_by_investment.empty:
             return None
@@ -146,64 +414,425 @@ def create_pie_chart(df):
         print(f"Error creating pie chart: {e}")
         return None
 
+# Running unit balances per fund: opening balances plus one grouped cumulative sum over Shares/Unit
+def build_holdings(df, opening_units, start_date, resolution='auto'):
+    units = df.loc[df['Shares/Unit'].notna(), ['Investment', 'Date', 'Shares/Unit']]
+    start = pd.Timestamp(start_date) if start_date else df['Date'].min()
+    # Funds held before the window enter as one opening transaction on its first day
+    opening = pd.DataFrame({
+        'Investment': opening_units.index.astype(str),
+        'Date': start,
+        'Shares/Unit': opening_units.to_numpy(dtype=float)
+    })
+    units = pd.concat([opening, units.astype({'Investment': str})], ignore_index=True)
+    if units.empty:
+        return pd.DataFrame(columns=['Investment', 'Date', 'Units'])
+    
+    last = max(df['Date'].max().normalize(), start)
+    resolution = pick_resolution(start, last, resolution)
+    periods = pd.PeriodIndex(units['Date'].dt.to_period(LINE_RESOLUTIONS[resolution]), name='Period')
+    changes = units.groupby(['Investment', periods], sort=True)['Shares/Unit'].sum()
+    balances = changes.groupby(level='Investment').cumsum().round(4)
+    
+    holdings = pd.DataFrame({
+        'Investment': balances.index.get_level_values('Investment'),
+        'Date': period_ends(balances.index.get_level_values('Period'), last),
+        'Units': balances.to_numpy()
+    })
+    # Carrying each fund's final balance to the end of the window so every line spans it
+    closing = holdings.groupby('Investment', sort=False).tail(1).assign(Date=last)
+    holdings = pd.concat([holdings, closing], ignore_index=True).drop_duplicates(['Investment', 'Date'])
+    return holdings.sort_values(['Investment', 'Date'], ignore_index=True)
+
+# Closing balance, change over the window and last unit-moving transaction per fund held or traded in it
+def summarize_holdings(df, holdings, opening_units):
+    if holdings.empty:
+        return []
+    closing = holdings.groupby('Investment', sort=True)['Units'].last()
+    opening = opening_units.reindex(closing.index, fill_value=0.0).round(4)
+    change = closing - opening
+    moves = df.loc[df['Shares/Unit'].notna()]
+    last_activity = moves.groupby(moves['Investment'].astype(str))['Date'].max().reindex(closing.index)
+    
+    # Funds that were emptied before the window and never touched again are not holdings; a fund
+    # bought and sold off inside the window still is, since its flows happened in the window
+    active = (closing.abs() > 1e-6) | (opening.abs() > 1e-6) | last_activity.notna()
+    table = pd.DataFrame({'units': closing, 'change': change.round(4), 'last_activity': last_activity.dt.strftime('%Y-%m-%d')})
+    table = table[active]
+    table = table.astype(object).where(table.notna(), None)
+    return [{'investment': investment, **row} for investment, row in table.to_dict('index').items()]
+
+# Creating line chart for units held per fund
+def create_holdings_chart(holdings):
+    if holdings.empty:
+        return None
+    
+    try:
+        fig = px.line(
+            holdings,
+            x='Date',
+            y='Units',
+            color='Investment',
+            line_shape='hv',
+            title='Units Held by Fund Over Time',
+            labels={'Units': 'Shares/Units Held'}
+        )
+        fig.update_layout(font_size=12, showlegend=True)
+        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+    except Exception as e:
+        print(f"Error creating holdings chart: {e}")
+        return None
+
+# Keeping a processed upload around so the table can be paged without resending it
+def store_dataset(dataset_id, df):
+    table = df[[col for col in TABLE_COLUMNS if col in df.columns]].reset_index(drop=True)
+    with datasets_lock:
+        datasets[dataset_id] = {'df': table, 'orders': {}}
+        while len(datasets) > MAX_DATASETS:
+            datasets.popitem(last=False)
+    return dataset_id
+
+# Looking up a dataset in memory, falling back to the on-disk cache
+def load_dataset(dataset_id):
+    with datasets_lock:
+        dataset = datasets.get(dataset_id)
+        if dataset is not None:
+            datasets.move_to_end(dataset_id)
+            return dataset
+    
+    table_path = cache_path(dataset_id, 'pkl')
+    if table_path is None or not os.path.exists(table_path):
+        return None
+    store_dataset(dataset_id, pd.read_pickle(table_path))
+    with datasets_lock:
+        return datasets.get(dataset_id)
+
+# Copying the upload to disk block by block so a worker can read it after the request ends; returns (path, hash)
+def spool_upload(stream, extension='csv'):
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    upload_path = os.path.join(UPLOAD_DIR, f'{uuid.uuid4().hex}.{extension}')
+    with open(upload_path, 'wb') as f:
+        for block in iter(lambda: stream.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+            f.write(block)
+    return upload_path, digest.hexdigest()
+
+# Results depend on the file, the window and what the ledger held after ingesting the file
+def result_key(content_hash, start_date, end_date, ledger_version):
+    key = f'v{CACHE_VERSION}:{content_hash}:{start_date}:{end_date}:{ledger_version}'
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def cache_path(content_hash, extension):
+    # Only hex digests are valid keys, so a dataset id from the URL can't escape the cache dir
+    if not all(c in '0123456789abcdef' for c in content_hash):
+        return None
+    return os.path.join(CACHE_DIR, f'{content_hash}.{extension}')
+
+# Reading a cached upload result, refreshing its position in the eviction order
+def load_cached_result(content_hash):
+    result_path = cache_path(content_hash, 'json')
+    if result_path is None or not os.path.exists(result_path):
+        return None
+    try:
+        with open(result_path, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        os.utime(result_path)
+        return result
+    except Exception as e:
+        print(f"Error reading cached result: {e}")
+        return None
+
+# Writing an upload result and its table, evicting the least recently used entries
+def save_cached_result(content_hash, result, df):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        table_path = cache_path(content_hash, 'pkl')
+        result_path = cache_path(content_hash, 'json')
+        
+        # Write to temporary files first so a crash never leaves a half-written entry
+        df[[col for col in TABLE_COLUMNS if col in df.columns]].to_pickle(table_path + '.tmp')
+        os.replace(table_path + '.tmp', table_path)
+        with open(result_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        os.replace(result_path + '.tmp', result_path)
+        
+        entries = sorted(
+            (entry for entry in os.scandir(CACHE_DIR) if entry.name.endswith('.json')),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries[:-MAX_CACHE_ENTRIES]:
+            stale_hash = entry.name[:-len('.json')]
+            for extension in ('json', 'pkl'):
+                stale_path = cache_path(stale_hash, extension)
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+    except Exception as e:
+        print(f"Error writing cached result: {e}")
+
+# Row positions for a sort, computed once per dataset, column and direction
+def sorted_positions(dataset, sort_column, ascending):
+    key = (sort_column, ascending)
+    with datasets_lock:
+        order = dataset['orders'].get(key)
+        values = dataset['df'][sort_column]
+    if order is not None:
+        return order
+    
+    # Sorting outside the lock so a large dataset doesn't hold up other requests;
+    # if two requests race, the first order stored wins
+    order = np.argsort(values.to_numpy(), kind='stable')
+    order = order if ascending else order[::-1]
+    with datasets_lock:
+        return dataset['orders'].setdefault(key, order)
+
+# Building one page of the table as columnar JSON with vectorized formatting
+def table_page(df, positions, page, page_size):
+    start = (page - 1) * page_size
+    rows = df.iloc[positions[start:start + page_size]]
+    
+    columns = {}
+    for col in rows.columns:
+        values = rows[col]
+        if col == 'Date':
+            values = values.dt.strftime('%Y-%m-%d')
+        # NaN is not valid JSON; send nulls instead
+        columns[col] = values.astype(object).where(values.notna(), None).tolist()
+    return columns
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+# Building the summary, charts and table handle for one window of transactions
+def build_dashboard(df, dataset_id, start_date, end_date, timings=None):
+    timings = {} if timings is None else timings
+    
+    # One pass over the rows; the summary and charts only touch the aggregate
+    started = time.perf_counter()
+    cube = build_cube(df)
+    summary = generate_summary(cube)
+    timings['aggregate'] = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    bar_chart = create_bar_chart(cube)
+    line_chart = create_line_chart(cube)
+    pie_chart = create_pie_chart(cube)
+    timings['charts'] = time.perf_counter() - started
+    
+    # Balances carry over from before the window, so start from the ledger's opening units
+    started = time.perf_counter()
+    opening_units = ledger.get_opening_units(start_date) if start_date else pd.Series(dtype=float)
+    holdings = build_holdings(df, opening_units, start_date)
+    holdings_table = summarize_holdings(df, holdings, opening_units)
+    holdings_chart = create_holdings_chart(holdings)
+    timings['holdings'] = time.perf_counter() - started
+    
+    # The transaction table is served page by page from /table/<dataset_id>
+    store_dataset(dataset_id, df)
+    
+    return {
+        'success': True,
+        'summary': summary,
+        'bar_chart': bar_chart,
+        'line_chart': line_chart,
+        'pie_chart': pie_chart,
+        'holdings_chart': holdings_chart,
+        'holdings': holdings_table,
+        'dataset_id': dataset_id,
+        'row_count': len(df),
+        'window': {'start': start_date, 'end': end_date}
+    }
+
+# Registering a job, dropping the oldest finished ones past the cap
+def create_job(**fields):
+    job_id = uuid.uuid4().hex
+    with jobs_lock:
+        jobs[job_id] = {'status': 'queued', 'created': time.time(), **fields}
+        finished = [jid for jid, job in jobs.items() if job['status'] in ('done', 'failed')]
+        for jid in finished[:max(len(jobs) - MAX_JOBS, 0)]:
+            del jobs[jid]
+    return job_id
+
+def update_job(job_id, **fields):
+    with jobs_lock:
+        jobs[job_id].update(fields)
+
+# Running an upload off the request thread: ingest, query the window, then build and cache the dashboard
+def run_upload_job(job_id, uploads, content_hash, requested_start, requested_end):
+    update_job(job_id, status='running', started=time.time())
+    temporary_paths = [path for _, path in uploads]
+    # Seconds per stage, reported by /jobs/<id>
+    timings = {}
+    try:
+        started = time.perf_counter()
+        statements = []
+        for name, path in uploads:
+            if name.lower().endswith('.zip'):
+                extracted = extract_statements(name, path)
+                temporary_paths.extend(extracted_path for _, extracted_path in extracted)
+                statements.extend(extracted)
+            else:
+                statements.append((name, path))
+        if not statements:
+            raise ValueError('No CSV files found in the upload')
+        
+        # A single statement streams straight into the ledger; several are parsed in parallel
+        if len(statements) == 1:
+            with open(statements[0][1], 'rb') as stream:
+                parsed, added = ingest_upload(stream, timings)
+        else:
+            parsed, added = ingest_statements(statements, timings)
+        # 'ingest' is everything but parsing: unpacking the upload and appending to the ledger
+        timings['ingest'] = time.perf_counter() - started - timings['parse']
+        if parsed == 0:
+            raise ValueError('No valid data found in the uploaded file')
+        
+        started = time.perf_counter()
+        start_date, end_date = resolve_window(requested_start, requested_end)
+        df = ledger.get_transactions(start_date, end_date)
+        timings['query'] = time.perf_counter() - started
+        if df.empty:
+            raise ValueError('No transactions found in the selected date range')
+        
+        dataset_id = result_key(content_hash, start_date, end_date, ledger.get_version())
+        result = build_dashboard(df, dataset_id, start_date, end_date, timings)
+        result['ingested'] = {'parsed': parsed, 'added': added}
+        
+        started = time.perf_counter()
+        save_cached_result(dataset_id, result, df)
+        timings['cache'] = time.perf_counter() - started
+        update_job(job_id, status='done', finished=time.time(), result=result, timings=timings)
+    except ValueError as e:
+        update_job(job_id, status='failed', finished=time.time(), error=str(e))
+    except Exception as e:
+        update_job(job_id, status='failed', finished=time.time(), error=f'Error processing file: {str(e)}')
+    finally:
+        for path in temporary_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
         
-        file = request.files['file']
-        if file.filename == '':
+        files = [file for file in request.files.getlist('file') if file.filename]
+        if not files:
             return jsonify({'error': 'No file selected'}), 400
         
-        if file and file.filename.endswith('.csv'):
-            try:
-                # Try UTF-8 first
-                csv_content = file.read().decode('utf-8')
-            except UnicodeDecodeError:
-                # If UTF-8 fails, try with latin-1 encoding
-                file.seek(0)  # Reset file pointer
-                try:
-                    csv_content = file.read().decode('latin-1')
-                except UnicodeDecodeError:
-                    # If both fail, try with errors='replace'
-                    file.seek(0)
-                    csv_content = file.read().decode('utf-8', errors='replace')
-            
-            df = process_data(csv_content)
-            
-            if df.empty:
-                return jsonify({'error': 'No valid data found in the uploaded file'}), 400
+        if all(file.filename.lower().endswith(('.csv', '.zip')) for file in files):
+            requested_start = request.form.get('start_date') or None
+            requested_end = request.form.get('end_date') or None
+            uploads, hashes = [], []
+            for file in files:
+                upload_path, file_hash = spool_upload(file.stream, file.filename.rsplit('.', 1)[-1].lower())
+                uploads.append((file.filename, upload_path))
+                hashes.append(file_hash)
+            # A set of files is identified by its members' hashes, whatever order they were picked in
+            content_hash = hashes[0] if len(hashes) == 1 else hashlib.sha256(''.join(sorted(hashes)).encode()).hexdigest()
+            filename = ', '.join(file.filename for file in files)
             
-            summary = generate_summary(df)
-            bar_chart = create_bar_chart(df)
-            line_chart = create_line_chart(df)
-            pie_chart = create_pie_chart(df)
+            # Re-uploads of the same statements are served from the cache without parsing;
+            # re-ingesting identical bytes would leave the ledger unchanged
+            start_date, end_date = resolve_window(requested_start, requested_end)
+            cached = load_cached_result(result_key(content_hash, start_date, end_date, ledger.get_version()))
+            if cached is not None:
+                for _, upload_path in uploads:
+                    os.remove(upload_path)
+                job_id = create_job(filename=filename, status='done', finished=time.time(), result=cached)
+            else:
+                job_id = create_job(filename=filename)
+                job_pool.submit(run_upload_job, job_id, uploads, content_hash, requested_start, requested_end)
             
-            # Convert DataFrame to dict for JSON response
-            table_data = df.to_dict('records')
-            # Convert dates to strings for JSON serialization
-            for record in table_data:
-                if 'Date' in record and pd.notna(record['Date']):
-                    record['Date'] = record['Date'].strftime('%Y-%m-%d')
-            
-            return jsonify({
-                'success': True,
-                'summary': summary,
-                'bar_chart': bar_chart,
-                'line_chart': line_chart,
-                'pie_chart': pie_chart,
-                'table_data': table_data
-            })
+            return jsonify({'job_id': job_id, 'status': 'done' if cached is not None else 'queued'}), 202
         else:
-            return jsonify({'error': 'Please upload a CSV file'}), 400
+            return jsonify({'error': 'Please upload CSV or ZIP files'}), 400
             
     except Exception as e:
         return jsonify({'error': f'Error processing file: {str(e)}'}), 500
 
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        job = dict(job)
+    
+    response = {'job_id': job_id, 'status': job['status'], 'filename': job.get('filename')}
+    if job.get('started'):
+        response['elapsed'] = round(job.get('finished', time.time()) - job['started'], 2)
+    if job.get('timings'):
+        response['timings'] = {stage: round(seconds, 3) for stage, seconds in job['timings'].items()}
+    if job['status'] == 'done':
+        response['result'] = job['result']
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
+
+@app.route('/dashboard')
+def get_dashboard():
+    try:
+        start_date, end_date = resolve_window(request.args.get('start') or None, request.args.get('end') or None)
+        if end_date is None:
+            return jsonify({'error': 'The ledger is empty, please upload a statement first'}), 404
+        
+        df = ledger.get_transactions(start_date, end_date)
+        if df.empty:
+            return jsonify({'error': 'No transactions found in the selected date range'}), 404
+        
+        dataset_id = result_key('ledger', start_date, end_date, ledger.get_version())
+        return jsonify(build_dashboard(df, dataset_id, start_date, end_date))
+    except Exception as e:
+        return jsonify({'error': f'Error loading dashboard: {str(e)}'}), 500
+
+@app.route('/line_chart/<dataset_id>')
+def get_line_chart(dataset_id):
+    try:
+        resolution = request.args.get('resolution', 'auto')
+        if resolution != 'auto' and resolution not in LINE_RESOLUTIONS:
+            return jsonify({'error': f'Unknown resolution {resolution}'}), 400
+        
+        dataset = load_dataset(dataset_id)
+        if dataset is None:
+            return jsonify({'error': 'Dataset not found, please upload the file again'}), 404
+        
+        return jsonify({'line_chart': create_line_chart(dataset['df'], resolution), 'resolution': resolution})
+    except Exception as e:
+        return jsonify({'error': f'Error loading line chart: {str(e)}'}), 500
+
+@app.route('/table/<dataset_id>')
+def get_table(dataset_id):
+    try:
+        dataset = load_dataset(dataset_id)
+        if dataset is None:
+            return jsonify({'error': 'Dataset not found, please upload the file again'}), 404
+        
+        df = dataset['df']
+        page_size = min(max(request.args.get('page_size', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+        total_pages = max((len(df) + page_size - 1) // page_size, 1)
+        page = min(max(request.args.get('page', 1, type=int), 1), total_pages)
+        sort_column = request.args.get('sort', 'Date')
+        if sort_column not in df.columns:
+            return jsonify({'error': f'Cannot sort by {sort_column}'}), 400
+        ascending = request.args.get('order', 'asc') != 'desc'
+        
+        positions = sorted_positions(dataset, sort_column, ascending)
+        
+        return jsonify({
+            'columns': list(df.columns),
+            'data': table_page(df, positions, page, page_size),
+            'page': page,
+            'page_size': page_size,
+            'total_pages': total_pages,
+            'total_rows': len(df),
+            'sort': sort_column,
+            'order': 'asc' if ascending else 'desc'
+        })
+    except Exception as e:
+        return jsonify({'error': f'Error loading table: {str(e)}'}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
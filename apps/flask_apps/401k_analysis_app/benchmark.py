@@ -0,0 +1,133 @@
+"""
+Benchmarks for the 401k upload pipeline on synthetic statements.
+
+parse:  compares the parsing paths on one statement
+        - object: default C parser with string columns left as Python objects (the old pipeline)
+        - c: C parser with categorical fund and transaction-type columns
+        - pyarrow: pyarrow CSV reader with declared column types and categoricals
+upload: drives /upload and /jobs/<id> through the Flask test client against a scratch
+        ledger and cache, reporting each stage of the job, response serialization, and the
+        rows parsed and inserted
+
+Usage: python benchmark.py parse [rows]
+       python benchmark.py upload [rows ...]
+"""
+import argparse
+import importlib
+import io
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from ledger import TransactionLedger
+from synthetic import make_statement_csv
+
+analysis = importlib.import_module('401k_analysis')
+
+UPLOAD_SIZES = [10_000, 100_000, 1_000_000]
+
+
+# The pipeline before typed reads: default parser, object strings, numerics converted afterwards
+def parse_objects(data):
+    df = pd.read_csv(io.BytesIO(data), thousands=',', dtype={'Investment': object, 'Transaction Type': object})
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    df = df.dropna(subset=analysis.REQUIRED_COLUMNS)
+    df['Amount ($)'] = pd.to_numeric(df['Amount ($)'], errors='coerce')
+    df['Shares/Unit'] = pd.to_numeric(df['Shares/Unit'], errors='coerce')
+    return df
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark_parse(rows):
+    data = make_statement_csv(rows)
+    print(f"{rows:,} rows, {len(data) / 1e6:.1f} MB CSV\n")
+
+    parsers = {
+        'object': parse_objects,
+        'c': lambda raw: analysis.process_data(io.BytesIO(raw), engine='c'),
+    }
+    if analysis.pa is not None:
+        parsers['pyarrow'] = lambda raw: analysis.process_data(io.BytesIO(raw), engine='pyarrow')
+    else:
+        print("pyarrow is not installed; skipping the pyarrow engine\n")
+
+    print(f"{'engine':<10}{'parse (s)':>12}{'memory (MB)':>14}{'groupby (s)':>14}")
+    for name, parse in parsers.items():
+        df, parse_seconds = timed(parse, data)
+        memory = df.memory_usage(deep=True).sum() / 1e6
+        _, groupby_seconds = timed(analysis.build_cube, df)
+        print(f"{name:<10}{parse_seconds:>12.2f}{memory:>14.1f}{groupby_seconds:>14.3f}")
+
+
+# Posting one statement and polling its job; returns the job status with client-side timings added
+def run_upload(client, data):
+    started = time.perf_counter()
+    response = client.post('/upload', data={'file': (io.BytesIO(data), 'statement.csv')},
+                           content_type='multipart/form-data')
+    submitted = time.perf_counter() - started
+
+    job_id = response.get_json()['job_id']
+    while True:
+        started = time.perf_counter()
+        response = client.get(f'/jobs/{job_id}')
+        serialize = time.perf_counter() - started
+        job = response.get_json()
+        if job['status'] in ('done', 'failed'):
+            break
+        time.sleep(0.05)
+
+    job['submit'] = submitted
+    job['serialize'] = serialize
+    job['response_bytes'] = len(response.data)
+    return job
+
+
+def benchmark_upload(sizes):
+    stages = ['submit', 'parse', 'ingest', 'query', 'aggregate', 'charts', 'holdings', 'cache', 'serialize']
+    print(f"{'rows':>10}" + ''.join(f'{stage + " (s)":>14}' for stage in stages)
+          + f"{'parsed':>12}{'inserted':>12}{'response (KB)':>15}")
+
+    for rows in sizes:
+        # A fresh ledger and cache per size so every run parses and ingests everything
+        with tempfile.TemporaryDirectory() as scratch:
+            analysis.ledger = TransactionLedger(os.path.join(scratch, 'ledger.db'))
+            analysis.CACHE_DIR = os.path.join(scratch, 'cache')
+            analysis.UPLOAD_DIR = os.path.join(scratch, 'uploads')
+            with analysis.datasets_lock:
+                analysis.datasets.clear()
+
+            job = run_upload(analysis.app.test_client(), make_statement_csv(rows))
+            if job['status'] != 'done':
+                print(f"{rows:>10,}  failed: {job.get('error')}")
+                continue
+            timings = {**job['timings'], 'submit': job['submit'], 'serialize': job['serialize']}
+            ingested = job['result']['ingested']
+            print(f"{rows:>10,}" + ''.join(f'{timings.get(stage, 0):>14.3f}' for stage in stages)
+                  + f"{ingested['parsed']:>12,}{ingested['added']:>12,}{job['response_bytes'] / 1024:>15.1f}")
+            analysis.ledger.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the 401k upload pipeline')
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+    parse_parser = subparsers.add_parser('parse', help='compare parsing engines')
+    parse_parser.add_argument('rows', type=int, nargs='?', default=1_000_000)
+    upload_parser = subparsers.add_parser('upload', help='time /upload end to end')
+    upload_parser.add_argument('rows', type=int, nargs='*', default=UPLOAD_SIZES)
+    args = parser.parse_args()
+
+    if args.mode == 'parse':
+        benchmark_parse(args.rows)
+    else:
+        benchmark_upload(args.rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from typing import Optional, Tuple
+from pathlib import Path
+
+
+class OccurrenceCounter:
+    """Running count of each dedupe key across the chunks of one statement"""
+
+    def __init__(self):
+        # Keyed by a 64-bit hash of the key columns, to stay small for statements of millions of rows
+        self.counts = pd.Series(dtype='int64')
+
+    def ordinals(self, keys: pd.DataFrame) -> np.ndarray:
+        """0 for the first row with a given key in the statement, 1 for the next, and so on"""
+        hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+        within = pd.Series(hashes).groupby(hashes, sort=False).cumcount().to_numpy()
+        ordinal = within + self.counts.reindex(hashes, fill_value=0).to_numpy(dtype='int64')
+        self.counts = self.counts.add(pd.Series(hashes).value_counts(), fill_value=0).astype('int64')
+        return ordinal
+
+
+class TransactionLedger:
+    """Persistent ledger of 401k transactions accumulated across uploads"""
+
+    def __init__(self, db_path: str = "data/ledger.db"):
+        """Initialize database connection"""
+        # Create data directory if it doesn't exist
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.db_path = db_path
+        self.conn = None
+        # Upload jobs share one connection across worker threads
+        self.lock = threading.RLock()
+        self.create_tables()
+
+    def get_connection(self):
+        """Get database connection"""
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+        return self.conn
+
+    def create_tables(self):
+        """Create database tables and indexes if they don't exist"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                investment TEXT NOT NULL,
+                transaction_type TEXT NOT NULL,
+                amount REAL NOT NULL,
+                shares REAL,
+                occurrence INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Ledgers created before the occurrence column keyed rows without it
+        cursor.execute("SELECT name FROM pragma_table_info('transactions')")
+        if 'occurrence' not in {row['name'] for row in cursor.fetchall()}:
+            cursor.execute('ALTER TABLE transactions ADD COLUMN occurrence INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('DROP INDEX IF EXISTS idx_transactions_dedupe')
+
+        # Dedupe key; IFNULL so rows without Shares/Unit still collide with each other. The occurrence
+        # keeps rows repeated inside one statement (say an employee and an employer contribution of
+        # the same amount on the same day) while the same rows uploaded again are skipped
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_occurrence
+            ON transactions (date, investment, transaction_type, amount, IFNULL(shares, ''), occurrence)
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_investment ON transactions (investment, date)')
+
+        conn.commit()
+
+    def add_transactions(self, df: pd.DataFrame, occurrences: Optional[OccurrenceCounter] = None) -> int:
+        """
+        Append cleaned transactions from one statement, skipping ones already in the ledger. Returns rows added.
+
+        Identical rows are told apart by their occurrence within the statement, so pass
+        one OccurrenceCounter across all chunks of a statement read in pieces.
+        """
+        df = df.dropna(subset=['Date', 'Amount ($)'])
+        if df.empty:
+            return 0
+
+        shares = df['Shares/Unit'] if 'Shares/Unit' in df.columns else pd.Series(None, index=df.index, dtype=float)
+        keys = pd.DataFrame({
+            'date': df['Date'].dt.strftime('%Y-%m-%d'),
+            'investment': df['Investment'].astype(str),
+            'transaction_type': df['Transaction Type'].astype(str),
+            'amount': df['Amount ($)'].astype(float),
+            'shares': shares.astype(float)
+        })
+        occurrence = (occurrences or OccurrenceCounter()).ordinals(keys)
+        rows = zip(
+            keys['date'].tolist(),
+            keys['investment'].tolist(),
+            keys['transaction_type'].tolist(),
+            keys['amount'].tolist(),
+            shares.astype(object).where(shares.notna(), None).tolist(),
+            occurrence.tolist()
+        )
+
+        with self.lock:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            before = conn.total_changes
+            cursor.executemany('''
+                INSERT OR IGNORE INTO transactions (date, investment, transaction_type, amount, shares, occurrence)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+            return conn.total_changes - before
+
+    def get_transactions(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.DataFrame:
+        """Get transactions between two 'YYYY-MM-DD' dates (inclusive), sorted by date"""
+        query = '''
+            SELECT
+                date as "Date",
+                investment as "Investment",
+                transaction_type as "Transaction Type",
+                shares as "Shares/Unit",
+                amount as "Amount ($)"
+            FROM transactions
+            WHERE date >= ? AND date <= ?
+            ORDER BY date, id
+        '''
+        with self.lock:
+            df = pd.read_sql_query(
+                query,
+                self.get_connection(),
+                params=(start_date or '0000-01-01', end_date or '9999-12-31')
+            )
+        df['Date'] = pd.to_datetime(df['Date'])
+        df['Shares/Unit'] = df['Shares/Unit'].astype(float)
+        df['Investment'] = df['Investment'].astype('category')
+        df['Transaction Type'] = df['Transaction Type'].astype('category')
+        return df
+
+    def get_opening_units(self, before_date: str) -> pd.Series:
+        """Units held per investment from transactions dated before a 'YYYY-MM-DD' date"""
+        query = '''
+            SELECT investment, SUM(shares) AS units
+            FROM transactions
+            WHERE date < ? AND shares IS NOT NULL
+            GROUP BY investment
+        '''
+        with self.lock:
+            cursor = self.get_connection().cursor()
+            cursor.execute(query, (before_date,))
+            rows = cursor.fetchall()
+        return pd.Series({row['investment']: row['units'] for row in rows}, dtype=float)
+
+    def get_date_range(self) -> Tuple[Optional[str], Optional[str]]:
+        """Get the earliest and latest transaction dates"""
+        with self.lock:
+            cursor = self.get_connection().cursor()
+            cursor.execute('SELECT MIN(date), MAX(date) FROM transactions')
+            return tuple(cursor.fetchone())
+
+    def get_version(self) -> str:
+        """Changes whenever rows are added, for keying cached results on the ledger contents"""
+        with self.lock:
+            cursor = self.get_connection().cursor()
+            cursor.execute('SELECT COUNT(*), IFNULL(MAX(id), 0) FROM transactions')
+            count, max_id = cursor.fetchone()
+        return f"{count}:{max_id}"
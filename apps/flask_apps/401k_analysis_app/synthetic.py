@@ -0,0 +1,92 @@
+"""
+Synthetic 401k statements in the export's CSV layout, for benchmarks and manual testing.
+
+Usage: python synthetic.py ROWS OUTPUT.csv [--funds N] [--types A,B,...] [--years N] [--seed N]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_FUNDS = ['FID 500 INDEX', 'VANG TARGET 2050', 'BOND INDEX', 'INTL INDEX', 'MID CAP INDEX', 'STABLE VALUE']
+
+# (mean amount, amount spread, moves units) per transaction type; other types get GENERIC_PROFILE
+TYPE_PROFILES = {
+    'CONTRIBUTION': (250.0, 50.0, True),
+    'Change in Market Value': (15.0, 400.0, False),
+    'Dividend': (20.0, 10.0, True),
+    'Fees': (-5.0, 2.0, True),
+    'Exchange In': (1000.0, 500.0, True),
+    'Exchange Out': (-1000.0, 500.0, True),
+}
+GENERIC_PROFILE = (100.0, 200.0, True)
+
+
+# Fund names: the defaults first, then numbered funds
+def fund_names(funds):
+    if isinstance(funds, int):
+        return DEFAULT_FUNDS[:funds] + [f'FUND {i + 1}' for i in range(len(DEFAULT_FUNDS), funds)]
+    return list(funds)
+
+
+# Building a statement with `rows` transactions spread over `years` years, sorted by date
+def make_statement(rows, funds=len(DEFAULT_FUNDS), transaction_types=None, years=5,
+                   start='2020-01-01', seed=0):
+    rng = np.random.default_rng(seed)
+    funds = fund_names(funds)
+    transaction_types = list(transaction_types or TYPE_PROFILES)
+    profiles = np.array([TYPE_PROFILES.get(name, GENERIC_PROFILE) for name in transaction_types], dtype=float)
+
+    dates = pd.Timestamp(start) + pd.to_timedelta(np.sort(rng.integers(0, years * 365, rows)), unit='D')
+    fund_codes = rng.integers(0, len(funds), rows)
+    type_codes = rng.integers(0, len(transaction_types), rows)
+
+    mean, spread, moves_units = profiles[type_codes].T
+    amounts = np.round(rng.normal(mean, spread), 2)
+    # Nudging repeats by a cent until every row is distinct on the ledger's dedupe key,
+    # so rows ingested match rows generated
+    while True:
+        keys = pd.DataFrame({'date': dates, 'fund': fund_codes, 'type': type_codes, 'amount': amounts})
+        repeats = keys.groupby(['date', 'fund', 'type', 'amount'], sort=False).cumcount().to_numpy()
+        if not repeats.any():
+            break
+        amounts = np.round(amounts + 0.01 * repeats, 2)
+    # Each fund's unit price drifts from its own starting level
+    prices = rng.uniform(20, 300, len(funds))[fund_codes] * (1 + 0.07 * (dates.year - dates.year.min()))
+    shares = np.where(moves_units.astype(bool), np.round(amounts / prices, 3), np.nan)
+
+    return pd.DataFrame({
+        'Date': dates.strftime('%m/%d/%Y'),
+        'Investment': np.array(funds)[fund_codes],
+        'Transaction Type': np.array(transaction_types)[type_codes],
+        'Shares/Unit': shares,
+        'Amount ($)': [f'{amount:,.2f}' for amount in amounts],
+    })
+
+
+# The statement as CSV bytes, the way it arrives in an upload
+def make_statement_csv(rows, **kwargs):
+    return make_statement(rows, **kwargs).to_csv(index=False).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic 401k statement CSV')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--funds', type=int, default=len(DEFAULT_FUNDS))
+    parser.add_argument('--types', help='comma-separated transaction types')
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    statement = make_statement(
+        args.rows, funds=args.funds,
+        transaction_types=args.types.split(',') if args.types else None,
+        years=args.years, seed=args.seed
+    )
+    statement.to_csv(args.output, index=False)
+    print(f"Wrote {len(statement):,} transactions to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import pandas as pd
+
+from ledger import OccurrenceCounter, TransactionLedger
+
+
+def make_statement():
+    """Three rows, two of them identical: an employee and an employer contribution on the same day"""
+    return pd.DataFrame({
+        'Date': pd.to_datetime(['2024-01-15', '2024-01-15', '2024-01-15']),
+        'Investment': pd.Categorical(['FUND A', 'FUND B', 'FUND B']),
+        'Transaction Type': pd.Categorical(['Contribution', 'Contribution', 'Contribution']),
+        'Amount ($)': [100.0, 300.0, 300.0],
+        'Shares/Unit': [1.0, 3.0, 3.0]
+    })
+
+
+def fund_total(ledger, investment):
+    df = ledger.get_transactions()
+    return df.loc[df['Investment'] == investment, 'Amount ($)'].sum()
+
+
+def test_repeated_rows_in_a_statement_are_kept_once_per_upload(tmp_path):
+    ledger = TransactionLedger(str(tmp_path / 'ledger.db'))
+
+    assert ledger.add_transactions(make_statement()) == 3
+    # Uploading the same statement again adds nothing
+    assert ledger.add_transactions(make_statement()) == 0
+
+    assert len(ledger.get_transactions()) == 3
+    assert fund_total(ledger, 'FUND B') == 600.0
+
+
+def test_repeated_rows_split_across_chunks(tmp_path):
+    ledger = TransactionLedger(str(tmp_path / 'ledger.db'))
+    statement = make_statement()
+
+    for _ in range(2):
+        occurrences = OccurrenceCounter()
+        added = sum(ledger.add_transactions(chunk, occurrences)
+                    for chunk in (statement.iloc[:2], statement.iloc[2:]))
+    assert added == 0
+
+    assert len(ledger.get_transactions()) == 3
+    assert fund_total(ledger, 'FUND B') == 600.0
@@ -9,13 +9,19 @@ import numpy as np
 from datetime import datetime
 import plotly.graph_objs as go
 import plotly.utils
+import os
 import json
 import random
-from typing import Dict
+from fixed_calculations import (build_contribution_schedule, simulate_portfolio,
+                               simulate_index_investment, random_portfolio_search,
+                               efficient_frontier, resume_dca, schedule_anchor)
+from simulation_store import SimulationStore
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'portfolio-comparison-app-2025'
 
+store = SimulationStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'simulations.db'))
+
 
 def download_data(tickers, start, end, interval):
     """Downloads stock data from Yahoo Finance."""
@@ -82,91 +88,195 @@ def generate_mock_data(ticker, start_date, end_date, interval):
     return pd.Series(prices, index=periods)
 
 
-def simulate_portfolio(stock_prices: pd.DataFrame, contribution: float, 
-                      initial_investment: float) -> pd.DataFrame:
-    """Simulates portfolio growth over time."""
-    if isinstance(stock_prices, pd.Series):
-        stock_prices = stock_prices.to_frame()
-    
-    periods = stock_prices.index
-    num_tickers = len(stock_prices.columns)
-    period_contribution = contribution / num_tickers
-    
-    shares_bought: Dict[str, np.ndarray] = {
-        ticker: np.zeros(len(stock_prices)) for ticker in stock_prices.columns
+def parse_schedule(schedule_data):
+    """Converts the optional contribution schedule from the request into engine arguments."""
+    schedule_data = schedule_data or {}
+
+    def dated_amounts(rows):
+        return [(row['date'], float(row['amount'])) for row in rows or [] if row.get('date')]
+
+    deposits = dated_amounts(schedule_data.get('deposits'))
+    return {
+        'annual_step_up': float(schedule_data.get('stepUpPct') or 0) / 100,
+        'lump_sums': dated_amounts(schedule_data.get('lumpSums')),
+        'pauses': [(row['start'], row['end']) for row in schedule_data.get('pauses') or []
+                   if row.get('start') and row.get('end')],
+        'deposits': deposits or None,
     }
-    leftover_cash: Dict[str, float] = {ticker: 0.0 for ticker in stock_prices.columns}
-    initial_per_stock = initial_investment / num_tickers
-    
-    total_invested = initial_investment
-    total_invested_list = [total_invested]
-    
-    portfolio_value_initial = 0.0
-    for ticker in stock_prices.columns:
-        price = stock_prices[ticker].iloc[0]
-        initial_shares = initial_per_stock // price
-        leftover_cash[ticker] = initial_per_stock % price
-        shares_bought[ticker][0] = initial_shares
-        portfolio_value_initial += shares_bought[ticker][0] * price
-    
-    portfolio_values = [portfolio_value_initial]
-    
-    for i in range(1, len(periods)):
-        portfolio_value = 0.0
-        total_invested += contribution
-        total_invested_list.append(total_invested)
-        
-        for ticker in stock_prices.columns:
-            price = stock_prices[ticker].iloc[i]
-            total_money = period_contribution + leftover_cash[ticker]
-            shares_to_buy = total_money // price
-            leftover_cash[ticker] = total_money % price
-            shares_bought[ticker][i] = shares_bought[ticker][i - 1] + shares_to_buy
-            portfolio_value += shares_bought[ticker][i] * price
-            
-        portfolio_values.append(portfolio_value)
-    
-    return pd.DataFrame({
-        'Portfolio Value': portfolio_values,
-        'Total Invested': total_invested_list
-    }, index=periods)
 
 
-def simulate_index_investment(index_prices: pd.Series, contribution: float, 
-                              initial_investment: float) -> pd.DataFrame:
-    """Simulates index investment growth over time."""
-    if isinstance(index_prices, pd.DataFrame):
-        index_prices = index_prices.iloc[:, 0]
-    
-    periods = index_prices.index
-    shares_bought = np.zeros(len(index_prices))
-    leftover_cash = 0.0
-    
-    total_invested = initial_investment
-    total_invested_list = [total_invested]
-    
-    price_initial = index_prices.iloc[0]
-    initial_shares = initial_investment // price_initial
-    leftover_cash = initial_investment % price_initial
-    shares_bought[0] = initial_shares
-    
-    portfolio_values = [shares_bought[0] * price_initial]
-    
-    for i in range(1, len(periods)):
-        price = index_prices.iloc[i]
-        total_money = contribution + leftover_cash
-        shares_to_buy = total_money // price
-        leftover_cash = total_money % price
-        shares_bought[i] = shares_bought[i - 1] + shares_to_buy
-        total_invested += contribution
-        total_invested_list.append(total_invested)
-        portfolio_values.append(shares_bought[i] * price)
-    
-    return pd.DataFrame({
-        'Index Value': portfolio_values,
-        'Total Invested': total_invested_list,
-        'Shares Held': shares_bought
-    }, index=periods)
+def simulate_saved(tickers, start_date, end_date, interval, contribution, schedule,
+                   initial_investment):
+    """
+    Simulates DCA into `tickers`, resuming the saved simulation for the same inputs.
+
+    Only bars after the saved state are downloaded, scheduled, simulated and stored,
+    so re-running with a later end date costs the new bars rather than the whole
+    history. If the provider has re-adjusted prices since the save, the saved shares
+    are rebased to the new adjustment (see `rebase_state`). Returns an empty frame
+    when no price data is available.
+    """
+    params = {
+        'tickers': tickers,
+        'start': start_date.strftime('%Y-%m-%d'),
+        'interval': interval,
+        'contribution': contribution,
+        'initial': initial_investment,
+        'schedule': schedule
+    }
+    sim_key = store.make_key(params)
+    saved = store.load(sim_key)
+
+    if saved:
+        last_date = pd.Timestamp(saved['last_date'])
+        if end_date <= last_date:
+            return saved_frame(store.load_bars(sim_key, before=end_date.isoformat()))
+        fetch_start = last_date.to_pydatetime()
+    else:
+        fetch_start = start_date
+
+    prices = download_data(tickers, fetch_start, end_date, interval)
+    if isinstance(prices, pd.Series):
+        prices = prices.to_frame(name=tickers[0])
+    if saved:
+        # The refetch starts at the settled bar so its adjusted close can be checked
+        prices = prices.reindex(columns=saved['columns'])
+        held = np.asarray(saved['state']['shares'], dtype=float) > 0
+        if not prices.loc[:, held].notna().all(axis=1).any():
+            # Nothing came back for some holding (the download failed or Yahoo is down): serve
+            # the stored bars and keep the saved run, rather than mistake the gap for new history
+            return saved_frame(store.load_bars(sim_key))
+        rebased = rebase_state(saved['state'], prices, last_date)
+        if rebased is None:
+            store.delete(sim_key)
+            return simulate_saved(tickers, start_date, end_date, interval, contribution,
+                                  schedule, initial_investment)
+        saved['state'] = rebased
+        prices = prices[prices.index > last_date]
+    if prices.empty:
+        return saved_frame(store.load_bars(sim_key)) if saved else pd.DataFrame()
+
+    # New bars continue the saved schedule from its anchor (step-up anniversary and amount)
+    anchor = saved['state']['schedule'] if saved else None
+    amounts = build_contribution_schedule(prices.index, contribution, anchor=anchor,
+                                          **schedule).to_numpy(dtype=float, copy=True)
+    if not saved:
+        amounts[0] += initial_investment
+
+    frame, state = resume_dca(prices, amounts, saved['state'] if saved else None)
+    settled = frame.iloc[:-1]
+    if len(settled):
+        state['last_close'] = prices.loc[settled.index[-1]].tolist()
+        state['schedule'] = schedule_anchor(settled.index, contribution,
+                                            schedule['annual_step_up'], anchor)
+        store.append(sim_key, params, list(prices.columns), state, zip(
+            [d.isoformat() for d in settled.index],
+            settled['Value'].tolist(),
+            settled['Total Invested'].tolist()
+        ))
+
+    if not saved:
+        return frame
+    # Everything up to the new latest bar is now stored; read it back in one pass
+    history = store.load_bars(sim_key, before=frame.index[-1].isoformat())
+    history['dates'].append(frame.index[-1].isoformat())
+    history['value'].append(frame['Value'].iloc[-1])
+    history['invested'].append(frame['Total Invested'].iloc[-1])
+    return saved_frame(history)
+
+
+def rebase_state(state, prices, last_date):
+    """
+    Rescales saved share counts when the provider has re-adjusted past prices.
+
+    Prices are split- and dividend-adjusted, so a split or payout after the save
+    changes the close of the bar the state was settled on. Scaling each holding by
+    saved/current close keeps its value at that bar. Returns None when `prices`
+    holds later bars but not that one, so the simulation has to be recomputed;
+    the caller checks first that the download returned anything for the holdings.
+    """
+    if last_date not in prices.index:
+        return None
+    current = prices.loc[last_date].to_numpy(dtype=float)
+    saved_close = np.asarray(state['last_close'], dtype=float)
+    shares = np.asarray(state['shares'], dtype=float)
+    held = shares > 0
+    if np.isnan(current[held]).any() or (current[held] <= 0).any():
+        return None
+    if np.allclose(current[held], saved_close[held], rtol=1e-6):
+        return state
+
+    ratio = np.ones_like(shares)
+    ratio[held] = saved_close[held] / current[held]
+    return {**state, 'shares': (shares * ratio).tolist(), 'last_close': current.tolist()}
+
+
+def saved_frame(bars):
+    """Builds the simulation frame from stored (dates, value, invested) columns."""
+    return pd.DataFrame({'Value': bars['value'], 'Total Invested': bars['invested']},
+                        index=pd.to_datetime(bars['dates']))
+
+
+def build_optimization(stock_prices, schedule, initial_investment, periods_per_year,
+                       num_portfolios):
+    """Runs the random-weight search and packages the efficient frontier for the UI."""
+    results = random_portfolio_search(stock_prices, schedule, initial_investment,
+                                      num_portfolios=num_portfolios,
+                                      periods_per_year=periods_per_year)
+    frontier = efficient_frontier(results)
+    tickers = list(stock_prices.columns)
+
+    def describe(row):
+        return {
+            'weights': {ticker: float(row[ticker]) for ticker in tickers},
+            'finalValue': float(row['Final Value']),
+            'return': float(row['Total Return (%)']),
+            'volatility': float(row['Volatility (%)'])
+        }
+
+    # Plot a sample of the cloud; the frontier itself is always drawn in full
+    cloud = results.sample(min(len(results), 3000), random_state=0)
+    frontier_hover = [
+        '<br>'.join(f'{ticker}: {row[ticker] * 100:.1f}%' for ticker in tickers)
+        for _, row in frontier.iterrows()
+    ]
+
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(
+        x=cloud['Volatility (%)'],
+        y=cloud['Final Value'],
+        mode='markers',
+        name='Random Portfolios',
+        marker=dict(color='#cbd5e1', size=4),
+        hovertemplate='<b>Volatility:</b> %{x:.1f}%<br><b>Value:</b> $%{y:,.2f}<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=frontier['Volatility (%)'],
+        y=frontier['Final Value'],
+        mode='lines+markers',
+        name='Efficient Frontier',
+        line=dict(color='#3b82f6', width=3),
+        text=frontier_hover,
+        hovertemplate='<b>Volatility:</b> %{x:.1f}%<br><b>Value:</b> $%{y:,.2f}<br>%{text}<extra></extra>'
+    ))
+    fig.update_layout(
+        title={'text': f'Efficient Frontier ({len(results):,} random portfolios)', 'font': {'size': 20, 'color': '#1e293b'}},
+        xaxis={'title': 'Annualized Volatility (%)', 'gridcolor': '#e2e8f0', 'showgrid': True},
+        yaxis={'title': 'Final Value (USD)', 'gridcolor': '#e2e8f0', 'showgrid': True, 'tickformat': '$,.0f'},
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font={'family': 'Inter, sans-serif', 'size': 12},
+        legend={'orientation': 'h', 'yanchor': 'bottom', 'y': 1.02, 'xanchor': 'center', 'x': 0.5, 'font': {'size': 14}},
+        height=600,
+        margin={'l': 60, 'r': 40, 't': 80, 'b': 60}
+    )
+
+    return {
+        'chart': json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder),
+        'maxValue': describe(results.loc[results['Final Value'].idxmax()]),
+        'minRisk': describe(results.loc[results['Volatility (%)'].idxmin()]),
+        'frontier': [describe(row) for _, row in frontier.iterrows()]
+    }
 
 
 @app.route('/')
@@ -188,10 +298,19 @@ def calculate():
         initial_investment = float(data['initialInvestment'])
         contribution = float(data['contribution'])
         frequency = data['frequency']
+        schedule = parse_schedule(data.get('schedule'))
+        optimize = data.get('mode') == 'optimize'
+        num_portfolios = min(int(data.get('numPortfolios', 100_000)), 200_000)
         
         if not tickers:
             return jsonify({'error': 'Please provide at least one ticker symbol'}), 400
         
+        if optimize and len(tickers) < 2:
+            return jsonify({'error': 'Optimize mode needs at least two ticker symbols'}), 400
+        
+        if optimize and num_portfolios < 1:
+            return jsonify({'error': 'Number of portfolios must be at least 1'}), 400
+        
         if start_date >= end_date:
             return jsonify({'error': 'Start date must be before end date'}), 400
         
@@ -199,12 +318,24 @@ def calculate():
             return jsonify({'error': 'End date cannot be in the future'}), 400
         
         interval = '1wk' if frequency == 'Weekly' else '1mo'
+        periods_per_year = 52 if interval == '1wk' else 12
+        
+        portfolio_df = index_df = pd.DataFrame()
+        if not optimize:
+            # Resume saved simulations so a later end date only simulates the new bars
+            portfolio_df = simulate_saved(tickers, start_date, end_date, interval,
+                                          contribution, schedule, initial_investment)
+            index_df = simulate_saved([index_ticker], start_date, end_date, interval,
+                                      contribution, schedule, initial_investment)
+            portfolio_df = portfolio_df.rename(columns={'Value': 'Portfolio Value'})
+            index_df = index_df.rename(columns={'Value': 'Index Value'})
         
-        # Try real data first, fall back to mock if it fails
-        stock_prices = download_data(tickers, start_date, end_date, interval)
-        index_prices = download_data(index_ticker, start_date, end_date, interval)
+        if portfolio_df.empty or index_df.empty:
+            # Try real data first, fall back to mock if it fails
+            stock_prices = download_data(tickers, start_date, end_date, interval)
+            index_prices = download_data(index_ticker, start_date, end_date, interval)
         
-        if stock_prices.empty or index_prices.empty:
+        if (portfolio_df.empty or index_df.empty) and (stock_prices.empty or index_prices.empty):
             print("Real data unavailable, using mock data with monthly frequency")
             # Always use monthly for mock data for better visualization
             if len(tickers) == 1:
@@ -214,12 +345,22 @@ def calculate():
                              for ticker in tickers}
                 stock_prices = pd.DataFrame(stock_data)
             index_prices = generate_mock_data(index_ticker, start_date, end_date, '1mo')
+            periods_per_year = 12
             # Adjust contribution to monthly if using weekly frequency
             if frequency == 'Weekly':
                 contribution = contribution * 4.33  # Convert weekly to monthly
         
-        portfolio_df = simulate_portfolio(stock_prices, contribution, initial_investment)
-        index_df = simulate_index_investment(index_prices, contribution, initial_investment)
+        if optimize:
+            # The optimizer needs a price for every asset on every bar; drop incomplete rows
+            # before scheduling so the displayed portfolio and the search invest the same deposits
+            stock_prices = stock_prices.dropna()
+        
+        if portfolio_df.empty or index_df.empty:
+            stock_schedule = build_contribution_schedule(stock_prices.index, contribution, **schedule)
+            index_schedule = build_contribution_schedule(index_prices.index, contribution, **schedule)
+
+            portfolio_df = simulate_portfolio(stock_prices, stock_schedule, initial_investment)
+            index_df = simulate_index_investment(index_prices, index_schedule, initial_investment)
         
         fig = go.Figure()
         
@@ -289,6 +430,11 @@ def calculate():
             }
         }
         
+        if optimize:
+            response['optimization'] = build_optimization(
+                stock_prices, stock_schedule, initial_investment, periods_per_year, num_portfolios
+            )
+        
         return jsonify(response)
         
     except Exception as e:
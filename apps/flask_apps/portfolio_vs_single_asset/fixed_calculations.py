@@ -1,102 +1,346 @@
 """
 Fixed calculation functions for portfolio simulation.
 These functions correctly include the initial portfolio value and track total investment.
+
+Contributions are expressed as a vector aligned to the price index, so step-ups,
+lump sums, pauses and irregular deposit lists all run through the same engine as
+the flat case. The engine loops over periods only; every asset is handled in a
+single NumPy operation per period.
+
+This file must stay identical in flask_apps/portfolio_vs_single_asset/ and
+streamlit_apps/stocks_vs_single_stock_streamlit_app/. Each app is built from its
+own directory, so neither can import the other's copy; change both together.
 """
 import pandas as pd
 import numpy as np
-from typing import Dict
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+Contribution = Union[float, np.ndarray, pd.Series]
+
+
+def anniversaries_passed(periods: pd.DatetimeIndex, start: pd.Timestamp) -> np.ndarray:
+    """Number of anniversaries of `start` reached by each of `periods`"""
+    years = periods.year - start.year
+    before_anniversary = (periods.month * 100 + periods.day) < (start.month * 100 + start.day)
+    return np.asarray(years - before_anniversary, dtype=float)
+
+
+def build_contribution_schedule(periods: pd.DatetimeIndex, contribution: float,
+                                annual_step_up: float = 0.0,
+                                lump_sums: Optional[Iterable[Tuple[str, float]]] = None,
+                                pauses: Optional[Iterable[Tuple[str, str]]] = None,
+                                deposits: Optional[Iterable[Tuple[str, float]]] = None,
+                                anchor: Optional[Dict] = None) -> pd.Series:
+    """
+    Builds a per-period contribution vector aligned to `periods`.
+
+    - `annual_step_up`: fractional raise applied on every anniversary of the first period (0.05 = +5%/year)
+    - `lump_sums`: (date, amount) one-off deposits, credited on the first period on/after the date
+    - `pauses`: (start, end) inclusive date ranges with no regular contribution
+    - `deposits`: irregular (date, amount) deposit list; replaces the regular contribution when given
+    - `anchor`: from `schedule_anchor`; continues an earlier schedule whose last period it records
+
+    The first period carries no regular contribution (it is funded by the initial
+    investment), matching the flat schedule used by the simulations. A continued
+    schedule has no such period, and skips dated amounts already credited before it.
+    """
+    periods = pd.DatetimeIndex(periods)
+    n = len(periods)
+    schedule = np.zeros(n)
+    if n == 0:
+        return pd.Series(schedule, index=periods)
+
+    if deposits is None:
+        if anchor is None:
+            schedule[1:] = contribution
+            anniversary = periods[0]
+        else:
+            schedule[:] = anchor['amount']
+            anniversary = pd.Timestamp(anchor['anniversary'])
+
+        if annual_step_up:
+            schedule *= (1 + annual_step_up) ** anniversaries_passed(periods, anniversary)
+
+        for pause_start, pause_end in pauses or []:
+            paused = (periods >= pd.Timestamp(pause_start)) & (periods <= pd.Timestamp(pause_end))
+            schedule[paused] = 0.0
+
+    for dated_amounts in (lump_sums, deposits):
+        if not dated_amounts:
+            continue
+        dates, amounts = zip(*dated_amounts)
+        dates = pd.DatetimeIndex(pd.to_datetime(list(dates)))
+        # Credit each amount to the first period on/after its date; drop anything past the range
+        positions = periods.searchsorted(dates, side='left')
+        amounts = np.asarray(amounts, dtype=float)
+        in_range = positions < n
+        if anchor is not None:
+            in_range &= dates > pd.Timestamp(anchor['last_date'])
+        np.add.at(schedule, positions[in_range], amounts[in_range])
+
+    return pd.Series(schedule, index=periods)
+
+
+def schedule_anchor(periods: pd.DatetimeIndex, contribution: float, annual_step_up: float = 0.0,
+                    anchor: Optional[Dict] = None) -> Dict:
+    """
+    Where a schedule over `periods` leaves off: its last period, the last step-up
+    anniversary reached and the regular contribution in effect from it.
 
+    Pass the result as `anchor` to `build_contribution_schedule` to schedule only the
+    periods that follow, instead of rebuilding from the first one.
+    """
+    periods = pd.DatetimeIndex(periods)
+    if anchor is None:
+        anniversary, amount = periods[0], float(contribution)
+    else:
+        anniversary, amount = pd.Timestamp(anchor['anniversary']), anchor['amount']
+
+    if annual_step_up:
+        years = int(anniversaries_passed(periods[-1:], anniversary)[0])
+        anniversary = anniversary + pd.DateOffset(years=years)
+        amount *= (1 + annual_step_up) ** years
+
+    return {
+        'anniversary': anniversary.isoformat(),
+        'amount': amount,
+        'last_date': periods[-1].isoformat()
+    }
+
+
+def contribution_vector(contribution: Contribution, periods: pd.Index,
+                        initial_investment: float) -> np.ndarray:
+    """
+    Returns the amount deposited at each period, with the initial investment at index 0.
 
-def simulate_portfolio(stock_prices: pd.DataFrame, contribution: float, initial_investment: float) -> pd.DataFrame:
+    A scalar is treated as a flat per-period contribution; a Series is aligned to `periods`.
+    """
+    if isinstance(contribution, pd.Series):
+        amounts = contribution.reindex(periods, fill_value=0.0).to_numpy(dtype=float, copy=True)
+    elif np.ndim(contribution) == 0:
+        amounts = np.full(len(periods), float(contribution))
+        if len(amounts):
+            amounts[0] = 0.0
+    else:
+        amounts = np.array(contribution, dtype=float)
+        if len(amounts) != len(periods):
+            raise ValueError("Contribution vector must have one entry per period")
+    if len(amounts):
+        amounts[0] += initial_investment
+    return amounts
+
+
+def simulate_dca(prices: np.ndarray, amounts: np.ndarray,
+                 weights: Optional[np.ndarray] = None,
+                 shares: Optional[np.ndarray] = None,
+                 leftover_cash: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Whole-share dollar-cost averaging over a (periods x assets) price matrix.
+
+    `amounts` is the cash deposited each period. It is split across assets by
+    `weights` (equal split when None); a (batch x assets) weight matrix simulates
+    every allocation at once. `shares` and `leftover_cash` resume a previous run.
+
+    Returns per-period values and shares held plus the final shares and leftover cash.
+    """
+    prices = np.asarray(prices, dtype=float)
+    if prices.ndim == 1:
+        prices = prices[:, None]
+    num_periods, num_assets = prices.shape
+
+    if weights is None:
+        per_asset = np.repeat((np.asarray(amounts, dtype=float) / num_assets)[:, None], num_assets, axis=1)
+        state_shape = (num_assets,)
+    else:
+        weights = np.asarray(weights, dtype=float)
+        per_asset = None
+        state_shape = weights.shape
+
+    shares = np.zeros(state_shape) if shares is None else np.array(shares, dtype=float)
+    cash = np.zeros(state_shape) if leftover_cash is None else np.array(leftover_cash, dtype=float)
+
+    values = np.empty((num_periods,) + state_shape[:-1])
+    shares_held = np.empty((num_periods, num_assets)) if weights is None else None
+
+    if weights is not None:
+        shares_to_buy = np.empty(state_shape)
+        scratch = np.empty(state_shape)
+
+    for i in range(num_periods):
+        price = prices[i]
+        if weights is None:
+            cash = cash + per_asset[i]
+            shares_to_buy = cash // price
+            cash = cash % price
+            shares = shares + shares_to_buy
+            shares_held[i] = shares
+        else:
+            # Batched allocations work in place and use floor(cash / price), which is several
+            # times cheaper than floor-divide/modulo on large arrays; a quotient that rounded up
+            # to the next whole share leaves negative cash and is stepped back by one.
+            np.multiply(weights, amounts[i], out=scratch)
+            cash += scratch
+            np.divide(cash, price, out=shares_to_buy)
+            np.floor(shares_to_buy, out=shares_to_buy)
+            np.multiply(shares_to_buy, price, out=scratch)
+            cash -= scratch
+            overdrawn = cash < 0
+            if overdrawn.any():
+                shares_to_buy -= overdrawn
+                cash += overdrawn * price
+            shares += shares_to_buy
+        values[i] = shares @ price
+
+    return {
+        'values': values,
+        'shares_held': shares_held,
+        'shares': shares,
+        'leftover_cash': cash,
+    }
+
+
+def simulate_portfolio(stock_prices: pd.DataFrame, contribution: Contribution,
+                       initial_investment: float) -> pd.DataFrame:
     """
     Simulates portfolio growth over time for a multi-stock portfolio.
-    
+
     FIXED: Now includes initial portfolio value and tracks total investment.
+    Each period's deposit is split equally among stocks.
     """
+    if isinstance(stock_prices, pd.Series):
+        stock_prices = stock_prices.to_frame()
+
     periods = stock_prices.index
-    num_tickers = len(stock_prices.columns)
-    
-    # The contribution per period is split equally among stocks
-    period_contribution = contribution / num_tickers
-    
-    # Initialize tracking variables
-    shares_bought: Dict[str, np.ndarray] = {ticker: np.zeros(len(stock_prices)) for ticker in stock_prices.columns}
-    leftover_cash: Dict[str, float] = {ticker: 0.0 for ticker in stock_prices.columns}
-    initial_per_stock = initial_investment / num_tickers
-    
-    # Track total invested amount
-    total_invested = initial_investment
-    total_invested_list = [total_invested]
-
-    # At the first period, buy as many whole shares as possible with initial investment
-    portfolio_value_initial = 0.0
-    for ticker in stock_prices.columns:
-        price = stock_prices[ticker].iloc[0]
-        initial_shares = initial_per_stock // price
-        leftover_cash[ticker] = initial_per_stock % price
-        shares_bought[ticker][0] = initial_shares
-        portfolio_value_initial += shares_bought[ticker][0] * price
-
-    portfolio_values = [portfolio_value_initial]
-    
-    # For subsequent periods, add contributions and buy more shares
-    for i in range(1, len(periods)):
-        portfolio_value = 0.0
-        total_invested += contribution
-        total_invested_list.append(total_invested)
-        
-        for ticker in stock_prices.columns:
-            price = stock_prices[ticker].iloc[i]
-            total_money = period_contribution + leftover_cash[ticker]
-            shares_to_buy = total_money // price
-            leftover_cash[ticker] = total_money % price
-            shares_bought[ticker][i] = shares_bought[ticker][i - 1] + shares_to_buy
-            portfolio_value += shares_bought[ticker][i] * price
-            
-        portfolio_values.append(portfolio_value)
-    
+    amounts = contribution_vector(contribution, periods, initial_investment)
+    result = simulate_dca(stock_prices.to_numpy(dtype=float), amounts)
+
     return pd.DataFrame({
-        'Portfolio Value': portfolio_values,
-        'Total Invested': total_invested_list
+        'Portfolio Value': result['values'],
+        'Total Invested': np.cumsum(amounts)
     }, index=periods)
 
 
-def simulate_index_investment(index_prices: pd.Series, contribution: float, initial_investment: float) -> pd.DataFrame:
+def simulate_index_investment(index_prices: pd.Series, contribution: Contribution,
+                              initial_investment: float) -> pd.DataFrame:
     """
     Simulates index investment growth over time.
-    
+
     FIXED: Now includes initial portfolio value and tracks total investment.
     """
+    if isinstance(index_prices, pd.DataFrame):
+        index_prices = index_prices.iloc[:, 0]
+
     periods = index_prices.index
-    shares_bought = np.zeros(len(index_prices))
-    leftover_cash = 0.0
-    
-    # Track total invested amount
-    total_invested = initial_investment
-    total_invested_list = [total_invested]
-
-    # Initial purchase with initial investment
-    price_initial = index_prices.iloc[0]
-    initial_shares = initial_investment // price_initial
-    leftover_cash = initial_investment % price_initial
-    shares_bought[0] = initial_shares
-    
-    # Calculate initial portfolio value
-    portfolio_values = [shares_bought[0] * price_initial]
-    
-    # For subsequent periods, add contributions and buy more shares
-    for i in range(1, len(periods)):
-        price = index_prices.iloc[i]
-        total_money = contribution + leftover_cash
-        shares_to_buy = total_money // price
-        leftover_cash = total_money % price
-        shares_bought[i] = shares_bought[i - 1] + shares_to_buy
-        total_invested += contribution
-        total_invested_list.append(total_invested)
-        portfolio_values.append(shares_bought[i] * price)
-    
+    amounts = contribution_vector(contribution, periods, initial_investment)
+    result = simulate_dca(index_prices.to_numpy(dtype=float), amounts)
+
     return pd.DataFrame({
-        'Index Value': portfolio_values,
-        'Total Invested': total_invested_list,
-        'Shares Held': shares_bought
+        'Index Value': result['values'],
+        'Total Invested': np.cumsum(amounts),
+        'Shares Held': result['shares_held'][:, 0]
     }, index=periods)
+
+
+def resume_dca(prices: pd.DataFrame, amounts: np.ndarray,
+               state: Optional[Dict] = None) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Runs the engine over `prices`, continuing from a saved `state` when given.
+
+    Work is proportional to the number of bars in `prices`. The returned state is
+    taken one bar before the end because the latest bar may still be forming;
+    resuming from it re-prices that bar with final data.
+
+    Returns a frame with 'Value' and 'Total Invested' plus the new state.
+    """
+    state = state or {}
+    price_matrix = prices.to_numpy(dtype=float)
+    amounts = np.asarray(amounts, dtype=float)
+
+    settled = simulate_dca(price_matrix[:-1], amounts[:-1],
+                           shares=state.get('shares'), leftover_cash=state.get('leftover_cash'))
+    latest = simulate_dca(price_matrix[-1:], amounts[-1:],
+                          shares=settled['shares'], leftover_cash=settled['leftover_cash'])
+
+    total_invested = state.get('total_invested', 0.0) + np.cumsum(amounts)
+    frame = pd.DataFrame({
+        'Value': np.concatenate([settled['values'], latest['values']]),
+        'Total Invested': total_invested
+    }, index=prices.index)
+
+    new_state = {
+        'shares': settled['shares'].tolist(),
+        'leftover_cash': settled['leftover_cash'].tolist(),
+        'total_invested': float(total_invested[-2]) if len(prices) > 1 else state.get('total_invested', 0.0),
+        'last_date': prices.index[-2].isoformat() if len(prices) > 1 else state.get('last_date'),
+    }
+    return frame, new_state
+
+
+def carry_contributions(contribution: pd.Series, periods: pd.Index) -> pd.Series:
+    """
+    Moves each contribution onto the first of `periods` on/after its date.
+
+    Used when rows are dropped from a price index after its schedule was built, so
+    deposits on a dropped date are invested at the next kept bar instead of lost;
+    any past the last kept bar land on that bar.
+    """
+    amounts = np.zeros(len(periods))
+    if len(periods):
+        positions = np.minimum(periods.searchsorted(contribution.index, side='left'), len(periods) - 1)
+        np.add.at(amounts, positions, contribution.to_numpy(dtype=float))
+    return pd.Series(amounts, index=periods)
+
+
+def random_portfolio_search(stock_prices: pd.DataFrame, contribution: Contribution,
+                            initial_investment: float, num_portfolios: int = 100_000,
+                            periods_per_year: int = 52, seed: Optional[int] = None,
+                            chunk_size: int = 5_000) -> pd.DataFrame:
+    """
+    Evaluates random allocations of the same contribution schedule across `stock_prices`.
+
+    Rows with a missing price are dropped; a contribution Series built on the full
+    index has those dates' deposits carried to the next kept bar.
+
+    Weights are drawn uniformly from the simplex. Each chunk of allocations goes
+    through the batched engine as one (batch x assets) matrix. Risk is the
+    annualized volatility of the weighted period returns, taken from the shared
+    covariance matrix.
+
+    Returns one row per allocation with its weights, final value, total return and volatility.
+    """
+    if isinstance(stock_prices, pd.Series):
+        stock_prices = stock_prices.to_frame()
+    stock_prices = stock_prices.dropna()
+
+    periods = stock_prices.index
+    if isinstance(contribution, pd.Series):
+        contribution = carry_contributions(contribution, periods)
+    prices = stock_prices.to_numpy(dtype=float)
+    amounts = contribution_vector(contribution, periods, initial_investment)
+    total_invested = amounts.sum()
+
+    rng = np.random.default_rng(seed)
+    weights = rng.dirichlet(np.ones(prices.shape[1]), size=num_portfolios)
+
+    final_values = np.empty(num_portfolios)
+    for start in range(0, num_portfolios, chunk_size):
+        chunk = weights[start:start + chunk_size]
+        final_values[start:start + len(chunk)] = simulate_dca(prices, amounts, chunk)['values'][-1]
+
+    period_returns = prices[1:] / prices[:-1] - 1
+    covariance = np.atleast_2d(np.cov(period_returns, rowvar=False))
+    volatility = np.sqrt(np.einsum('bi,ij,bj->b', weights, covariance, weights) * periods_per_year)
+
+    results = pd.DataFrame(weights, columns=stock_prices.columns)
+    results['Final Value'] = final_values
+    results['Total Return (%)'] = (final_values / total_invested - 1) * 100
+    results['Volatility (%)'] = volatility * 100
+    return results
+
+
+def efficient_frontier(results: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the allocations that no other allocation beats on both final value and volatility."""
+    ordered = results.sort_values('Volatility (%)')
+    best_so_far = np.maximum.accumulate(ordered['Final Value'].to_numpy())
+    on_frontier = ordered['Final Value'].to_numpy() >= best_so_far
+    return ordered[on_frontier]
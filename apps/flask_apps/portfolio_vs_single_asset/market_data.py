@@ -0,0 +1,427 @@
+"""
+Yahoo Finance access for the Streamlit simulator.
+
+Ticker symbols are validated in one batched probe per run, and the verdicts are
+remembered in a small SQLite cache with a time-to-live. Price downloads retry only
+the tickers that failed, with jittered exponential backoff, on a worker thread so
+the script thread stays free to report progress. Retries fetch the failed tickers
+one per request on a bounded pool, paced by a shared token bucket. Prices are kept
+per ticker with the date range they cover, so later requests for a sub-range or a
+subset are sliced from memory and only the uncovered edges are downloaded. Closes
+are dividend- and split-adjusted, so an edge whose overlapping bars no longer match
+the cache means history was re-adjusted, and the ticker's whole range is refetched.
+
+This file must stay identical in streamlit_apps/stocks_vs_single_stock_streamlit_app/
+and flask_apps/portfolio_vs_single_asset/. Each app is built from its own
+directory, so neither can import the other's copy; change both together.
+"""
+import queue
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+import yfinance as yf
+
+# How long a verdict is trusted; invalid symbols are rechecked sooner in case of a transient miss
+VALID_TTL_SECONDS = 7 * 24 * 3600
+INVALID_TTL_SECONDS = 24 * 3600
+
+# Retry waits grow from RETRY_BASE_SECONDS and are capped at RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 16.0
+
+# Per-ticker requests: at most TICKER_WORKERS in flight, REQUESTS_PER_SECOND on average across all sessions
+TICKER_WORKERS = 8
+REQUESTS_PER_SECOND = 4.0
+REQUEST_BURST = 8
+
+# Cached price series are refetched in full once they are this old; at most PRICE_CACHE_ENTRIES are kept
+PRICE_TTL_SECONDS = 24 * 3600
+PRICE_CACHE_ENTRIES = 256
+
+download_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='market-data')
+ticker_pool = ThreadPoolExecutor(max_workers=TICKER_WORKERS, thread_name_prefix='market-data-ticker')
+
+
+class TickerCache:
+    """SQLite cache of known-valid and known-invalid ticker symbols"""
+
+    def __init__(self, db_path: str = "data/tickers.db",
+                 valid_ttl: float = VALID_TTL_SECONDS, invalid_ttl: float = INVALID_TTL_SECONDS):
+        """Initialize database connection"""
+        # Create data directory if it doesn't exist
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.db_path = db_path
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self.conn = None
+        # Every Streamlit session thread shares this cache, and with it one connection
+        self.lock = threading.Lock()
+        self.create_tables()
+
+    def get_connection(self):
+        """Get database connection"""
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+        return self.conn
+
+    def create_tables(self):
+        """Create database tables if they don't exist"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tickers (
+                ticker TEXT PRIMARY KEY,
+                valid INTEGER NOT NULL,
+                checked_at REAL NOT NULL
+            )
+        ''')
+
+        conn.commit()
+
+    def lookup(self, tickers: Iterable[str]) -> Dict[str, bool]:
+        """Get the unexpired verdicts for the given tickers; unknown or expired ones are left out"""
+        tickers = list(tickers)
+        if not tickers:
+            return {}
+
+        placeholders = ', '.join('?' * len(tickers))
+        with self.lock:
+            cursor = self.get_connection().cursor()
+            cursor.execute(f'SELECT ticker, valid, checked_at FROM tickers WHERE ticker IN ({placeholders})', tickers)
+            rows = cursor.fetchall()
+
+        now = time.time()
+        verdicts = {}
+        for row in rows:
+            ttl = self.valid_ttl if row['valid'] else self.invalid_ttl
+            if now - row['checked_at'] < ttl:
+                verdicts[row['ticker']] = bool(row['valid'])
+        return verdicts
+
+    def record(self, verdicts: Dict[str, bool]):
+        """Insert or refresh verdicts"""
+        if not verdicts:
+            return
+
+        now = time.time()
+        with self.lock:
+            conn = self.get_connection()
+            conn.executemany(
+                'INSERT OR REPLACE INTO tickers (ticker, valid, checked_at) VALUES (?, ?, ?)',
+                [(ticker, int(valid), now) for ticker, valid in verdicts.items()]
+            )
+            conn.commit()
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second on average, in bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting until one is due; only call this from worker threads"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserving the token up front keeps concurrent callers in line without holding the lock
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+yahoo_rate_limiter = TokenBucket(REQUESTS_PER_SECOND, REQUEST_BURST)
+
+
+class PriceCache:
+    """
+    In-memory close series per (ticker, interval), each with the [start, end) range it covers.
+
+    Entries expire `ttl` seconds after they were first downloaded, and beyond
+    `max_entries` the least recently used one is dropped.
+    """
+
+    def __init__(self, ttl: float = PRICE_TTL_SECONDS, max_entries: int = PRICE_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, key: Tuple[str, str]) -> Optional[Dict]:
+        """The live entry for `key`, marked as most recently used; call with the lock held"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry['created'] >= self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def missing_ranges(self, ticker: str, interval: str, start: pd.Timestamp, end: pd.Timestamp) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """Ranges to download so the entry covers [start, end)"""
+        with self.lock:
+            entry = self.lookup((ticker, interval))
+        if entry is None:
+            return [(start, end)]
+
+        # Each edge overlaps cached bars: the answer can't be empty for a live ticker, a settled
+        # bar is there to compare against (see store), and the last bar, which may still have
+        # been forming, is refreshed
+        bars = entry['series'].index
+        gaps = []
+        if start < entry['start']:
+            gaps.append((start, bars[0] + pd.Timedelta(days=1)))
+        if end > entry['end']:
+            gaps.append((bars[max(len(bars) - 2, 0)], end))
+        return gaps
+
+    def store(self, ticker: str, interval: str, start: pd.Timestamp, end: pd.Timestamp, series: pd.Series) -> bool:
+        """
+        Merge a downloaded range into the entry; fresh bars replace cached ones.
+
+        Returns False, dropping the entry, when a settled bar in the overlap has a
+        different close: history was re-adjusted since it was cached, so the cached
+        bars are on another basis and the caller has to fetch the full range again.
+        """
+        series = series.dropna().sort_index()
+        if series.empty:
+            return True
+        with self.lock:
+            key = (ticker, interval)
+            entry = self.lookup(key)
+            if entry is None:
+                self.entries[key] = {'start': start, 'end': end, 'series': series, 'created': time.time()}
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                return True
+
+            cached = entry['series']
+            # The last cached bar may have been forming when it was fetched, so it is allowed to differ
+            overlap = cached.index[:-1].intersection(series.index)
+            if ((series[overlap] - cached[overlap]).abs() > 1e-6 * cached[overlap].abs()).any():
+                del self.entries[key]
+                return False
+
+            entry['series'] = series.combine_first(cached).sort_index()
+            entry['start'] = min(entry['start'], start)
+            entry['end'] = max(entry['end'], end)
+            return True
+
+    def get(self, ticker: str, interval: str, start: pd.Timestamp, end: pd.Timestamp) -> Optional[pd.Series]:
+        """Cached closes within [start, end), or None if the ticker isn't cached"""
+        with self.lock:
+            entry = self.lookup((ticker, interval))
+        if entry is None:
+            return None
+        series = entry['series']
+        return series[(series.index >= start) & (series.index < end)].rename(ticker)
+
+
+# Close prices as one column per ticker, whatever shape yf.download returned
+def close_columns(data: pd.DataFrame, tickers: List[str]) -> pd.DataFrame:
+    if data is None or data.empty or 'Close' not in data.columns.get_level_values(0):
+        return pd.DataFrame()
+    close = data['Close']
+    if isinstance(close, pd.Series):
+        close = close.to_frame(tickers[0])
+    return close
+
+
+def validate_tickers(tickers: Iterable[str], cache: Optional[TickerCache] = None) -> Tuple[List[str], List[str]]:
+    """
+    Splits tickers into (valid, invalid) with at most one Yahoo round trip.
+
+    Cached verdicts are used as-is; every other symbol goes into a single short
+    daily download, and a symbol is valid if it has any recent close. If the probe
+    fails or comes back empty, the unchecked symbols are passed through as valid
+    without being cached, so the price download decides.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    verdicts = cache.lookup(tickers) if cache is not None else {}
+    unknown = [ticker for ticker in tickers if ticker not in verdicts]
+
+    if unknown:
+        try:
+            data = yf.download(unknown, period='5d', interval='1d', auto_adjust=True, progress=False)
+            close = close_columns(data, unknown)
+            # An empty answer for every symbol looks more like an outage than a batch of bad tickers
+            if not close.empty:
+                probed = {ticker: bool(ticker in close.columns and close[ticker].notna().any()) for ticker in unknown}
+                if cache is not None:
+                    cache.record(probed)
+                verdicts.update(probed)
+        except Exception as e:
+            print(f"Error validating tickers: {e}")
+
+    valid = [ticker for ticker in tickers if verdicts.get(ticker, True)]
+    invalid = [ticker for ticker in tickers if not verdicts.get(ticker, True)]
+    return valid, invalid
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_SECONDS, cap: float = RETRY_MAX_SECONDS) -> float:
+    """Full-jitter exponential backoff: a uniform wait up to min(cap, base * 2**attempt)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def download_close(tickers: List[str], start, end, interval: str) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """One bulk request for every ticker; returns the closes that came back and an error for each one that didn't."""
+    try:
+        data = yf.download(tickers, start=start, end=end, interval=interval, auto_adjust=True, progress=False)
+        close = close_columns(data, tickers)
+        error = "No data available for the specified date range"
+    except Exception as e:
+        close = pd.DataFrame()
+        error = str(e)
+
+    fetched = [ticker for ticker in tickers if ticker in close.columns and close[ticker].notna().any()]
+    return close[fetched], {ticker: error for ticker in tickers if ticker not in fetched}
+
+
+def fetch_ticker(ticker: str, start, end, interval: str) -> pd.Series:
+    """Close prices for a single ticker, paced by the shared rate limiter"""
+    yahoo_rate_limiter.acquire()
+    data = yf.download(ticker, start=start, end=end, interval=interval, auto_adjust=True, progress=False)
+    close = close_columns(data, [ticker])
+    if ticker not in close.columns or not close[ticker].notna().any():
+        raise ValueError("No data available for the specified date range")
+    return close[ticker]
+
+
+def fetch_each(tickers: List[str], start, end, interval: str,
+               report: Callable[[str], None]) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """Fetches tickers one request each on the ticker pool, reporting every one as it finishes."""
+    futures = {ticker_pool.submit(fetch_ticker, ticker, start, end, interval): ticker for ticker in tickers}
+    columns = {}
+    errors = {}
+    for done, future in enumerate(as_completed(futures), 1):
+        ticker = futures[future]
+        try:
+            columns[ticker] = future.result()
+            report(f"Fetched {ticker} ({done}/{len(tickers)})")
+        except Exception as e:
+            errors[ticker] = str(e)
+            report(f"{ticker} failed ({done}/{len(tickers)}): {e}")
+    return pd.DataFrame(columns), errors
+
+
+def fetch_close(tickers: List[str], start, end, interval: str, max_retries: int = 3,
+                on_progress: Optional[Callable[[str], None]] = None) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """
+    Downloads close prices, re-requesting only the tickers that came back missing or empty.
+
+    The first attempt is one bulk request; retries fetch the remaining tickers
+    concurrently, one request each. Returns one column per ticker that succeeded
+    plus {ticker: last error} for the ones that never did. Waits between attempts,
+    so run it off the script thread (see run_in_background).
+    """
+    report = on_progress or (lambda message: None)
+    pending = list(tickers)
+    frames = []
+    failures = {}
+
+    for attempt in range(max_retries):
+        if attempt:
+            delay = backoff_delay(attempt - 1)
+            report(f"Retrying {', '.join(pending)} in {delay:.1f}s...")
+            time.sleep(delay)
+            report(f"Download attempt {attempt + 1}/{max_retries}: fetching {len(pending)} ticker(s) individually...")
+            close, errors = fetch_each(pending, start, end, interval, report)
+        else:
+            report(f"Download attempt 1/{max_retries} ({len(pending)} ticker(s))...")
+            close, errors = download_close(pending, start, end, interval)
+
+        if not close.empty:
+            frames.append(close)
+        # Each attempt reports an error for exactly the tickers still missing
+        failures = errors
+        pending = [ticker for ticker in pending if ticker in errors]
+        if not pending:
+            break
+
+    if not frames:
+        return pd.DataFrame(), failures
+    close = pd.concat(frames, axis=1).sort_index()
+    return close[[ticker for ticker in tickers if ticker in close.columns]], failures
+
+
+def load_close(tickers: List[str], start, end, interval: str, cache: PriceCache, max_retries: int = 3,
+               on_progress: Optional[Callable[[str], None]] = None) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """
+    Close prices for [start, end), served from `cache` and downloading only what it doesn't cover.
+
+    Tickers missing the same range are fetched together. A ticker whose edge
+    download fails is still served from what the cache holds and is listed in
+    the returned failures. A ticker whose edge shows re-adjusted prices is
+    fetched again over the whole of [start, end).
+    """
+    report = on_progress or (lambda message: None)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+
+    gaps = {}
+    for ticker in tickers:
+        for gap in cache.missing_ranges(ticker, interval, start, end):
+            gaps.setdefault(gap, []).append(ticker)
+    if not gaps:
+        report("Using cached prices...")
+
+    failures = {}
+    readjusted = []
+    for (gap_start, gap_end), group in gaps.items():
+        close, errors = fetch_close(group, gap_start.strftime('%Y-%m-%d'), gap_end.strftime('%Y-%m-%d'),
+                                    interval, max_retries, report)
+        for ticker in close.columns:
+            if not cache.store(ticker, interval, gap_start, gap_end, close[ticker]):
+                readjusted.append(ticker)
+        failures.update(errors)
+
+    if readjusted:
+        readjusted = list(dict.fromkeys(readjusted))
+        report(f"Prices for {', '.join(readjusted)} were re-adjusted; fetching the full range...")
+        close, errors = fetch_close(readjusted, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'),
+                                    interval, max_retries, report)
+        for ticker in close.columns:
+            cache.store(ticker, interval, start, end, close[ticker])
+        failures.update(errors)
+
+    columns = [cache.get(ticker, interval, start, end) for ticker in tickers]
+    columns = [series for series in columns if series is not None and not series.empty]
+    if not columns:
+        return pd.DataFrame(), failures
+    return pd.concat(columns, axis=1).sort_index(), failures
+
+
+def run_in_background(func: Callable, *args, on_message: Optional[Callable[[str], None]] = None, **kwargs):
+    """
+    Runs func(*args, on_progress=..., **kwargs) on the download pool and relays its
+    progress messages to on_message from the calling thread, which never sleeps:
+    it only waits for the next message or for the result.
+    """
+    messages = queue.Queue()
+    future = download_pool.submit(func, *args, on_progress=messages.put, **kwargs)
+    while True:
+        try:
+            message = messages.get(timeout=0.1)
+        except queue.Empty:
+            if future.done():
+                break
+            continue
+        if on_message is not None:
+            on_message(message)
+    return future.result()
@@ -0,0 +1,138 @@
+import sqlite3
+import json
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+
+
+class SimulationStore:
+    """SQLite persistence for simulations so a later end date resumes from the saved state"""
+
+    def __init__(self, db_path: str = "data/simulations.db"):
+        """Initialize database connection"""
+        # Create data directory if it doesn't exist
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.db_path = db_path
+        self.conn = None
+        # Flask serves requests on several threads; they share one connection, one statement at a time
+        self.lock = threading.Lock()
+        self.create_tables()
+
+    def get_connection(self):
+        """Get database connection"""
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+        return self.conn
+
+    def create_tables(self):
+        """Create database tables if they don't exist"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # Runs saved before bars moved to their own table kept the series as one JSON blob;
+        # they are only a cache, so drop them and let the next request recompute
+        cursor.execute("SELECT name FROM pragma_table_info('simulations')")
+        if 'series' in {row['name'] for row in cursor.fetchall()}:
+            cursor.execute('DROP TABLE simulations')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS simulations (
+                sim_key TEXT PRIMARY KEY,
+                params TEXT NOT NULL,
+                columns TEXT NOT NULL,
+                state TEXT NOT NULL,
+                last_date TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS simulation_bars (
+                sim_key TEXT NOT NULL,
+                date TEXT NOT NULL,
+                value REAL NOT NULL,
+                invested REAL NOT NULL,
+                PRIMARY KEY (sim_key, date)
+            )
+        ''')
+
+        conn.commit()
+
+    @staticmethod
+    def make_key(params: Dict) -> str:
+        """Stable key for the inputs that define a simulation (everything but the end date)"""
+        payload = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def load(self, sim_key: str) -> Optional[Dict]:
+        """Get a saved simulation's state, or None if it was never stored"""
+        with self.lock:
+            cursor = self.get_connection().cursor()
+            cursor.execute('SELECT * FROM simulations WHERE sim_key = ?', (sim_key,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+
+        return {
+            'params': json.loads(row['params']),
+            'columns': json.loads(row['columns']),
+            'state': json.loads(row['state']),
+            'last_date': row['last_date']
+        }
+
+    def load_bars(self, sim_key: str, before: Optional[str] = None) -> Dict[str, List]:
+        """Get a simulation's settled bars in date order, optionally only those dated before `before`"""
+        query = 'SELECT date, value, invested FROM simulation_bars WHERE sim_key = ?'
+        args = [sim_key]
+        if before is not None:
+            query += ' AND date < ?'
+            args.append(before)
+
+        with self.lock:
+            cursor = self.get_connection().cursor()
+            cursor.execute(query + ' ORDER BY date', args)
+            rows = cursor.fetchall()
+
+        return {
+            'dates': [row['date'] for row in rows],
+            'value': [row['value'] for row in rows],
+            'invested': [row['invested'] for row in rows]
+        }
+
+    def append(self, sim_key: str, params: Dict, columns: list, state: Dict,
+               bars: Iterable[Tuple[str, float, float]]) -> bool:
+        """Record a simulation's new state and add the (date, value, invested) bars settled since the last one"""
+        try:
+            with self.lock:
+                conn = self.get_connection()
+                with conn:
+                    conn.execute('''
+                        INSERT OR REPLACE INTO simulations (
+                            sim_key, params, columns, state, last_date, updated_at
+                        ) VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ''', (
+                        sim_key,
+                        json.dumps(params, sort_keys=True, default=str),
+                        json.dumps(columns),
+                        json.dumps(state),
+                        state['last_date']
+                    ))
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO simulation_bars (sim_key, date, value, invested) VALUES (?, ?, ?, ?)',
+                        [(sim_key, date, value, invested) for date, value, invested in bars]
+                    )
+            return True
+        except Exception as e:
+            print(f"Error saving simulation: {e}")
+            return False
+
+    def delete(self, sim_key: str):
+        """Forget a saved simulation and its bars"""
+        with self.lock:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('DELETE FROM simulations WHERE sim_key = ?', (sim_key,))
+                conn.execute('DELETE FROM simulation_bars WHERE sim_key = ?', (sim_key,))
@@ -1,10 +1,11 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
+import os
 from datetime import datetime
-from typing import List, Dict, Union
+from typing import List, Union
+from fixed_calculations import simulate_portfolio, simulate_index_investment
+from market_data import PriceCache, TickerCache, load_close, run_in_background, validate_tickers
 
 # Configuration
 APP_TITLE = "Stocks Portfolio vs Single Asset Comparison"
@@ -16,139 +17,43 @@ DEFAULT_CONTRIBUTION = 400
 DEFAULT_TICKERS = "AAPL, NVDA, MSFT, AMZN, META, GOOGL, TSLA, BRK-B, JPM"
 DEFAULT_INDEX_TICKER = "SPY"
 
-import time
-
-@st.cache_data
-def validate_ticker(ticker: str) -> bool:
-    """Validates if a ticker symbol exists."""
-    try:
-        ticker_obj = yf.Ticker(ticker)
-        info = ticker_obj.info
-        return 'regularMarketPrice' in info and info['regularMarketPrice'] is not None
-    except Exception as e:
-        error_text = st.empty()
-        error_text.error(f"Error validating ticker {ticker}: {str(e)}")
-        time.sleep(1)
-        error_text.empty()
-        return False
-
-@st.cache_data
-def download_data(tickers: Union[str, List[str]], start: datetime, end: datetime, interval: str, max_retries: int = 3) -> pd.DataFrame:
-    """Downloads stock data from Yahoo Finance with retry logic."""
-    for attempt in range(max_retries):
-        try:
-            # If it's a list of tickers, validate each one
-            if isinstance(tickers, list):
-                valid_tickers = []
-                for ticker in tickers:
-                    if validate_ticker(ticker.strip()):
-                        valid_tickers.append(ticker.strip())
-                    else:
-                        warning_text = st.empty()
-                        warning_text.warning(f"Invalid ticker: {ticker}. Skipping...")
-                        time.sleep(1)
-                        warning_text.empty()
-                
-                if not valid_tickers:
-                    st.error("No valid tickers provided.")
-                    return pd.DataFrame()
-                
-                tickers = valid_tickers
-            else:
-                # Single ticker validation
-                if not validate_ticker(tickers):
-                    st.error(f"Invalid ticker: {tickers}")
-                    return pd.DataFrame()
-
-            # Add progress message using the parent container's empty element
-            progress_msg = st.empty()
-            progress_msg.text(f"Download attempt {attempt + 1}/{max_retries}...")
-            
-            data = yf.download(tickers, start=start, end=end, interval=interval, auto_adjust=True, progress=False)
-            progress_msg.empty()
-        
-            if data.empty:
-                warning_text = st.empty()
-                warning_text.warning(f"Attempt {attempt + 1}: No data available for the specified date range.")
-                if attempt < max_retries - 1:
-                    time.sleep(2)  # Wait before retrying
-                    warning_text.empty()
-                    continue
-                st.error("Failed to get data after all attempts.")
-                return pd.DataFrame()
-                
-            if 'Close' not in data.columns and not isinstance(data['Close'], pd.DataFrame):
-                warning_text = st.empty()
-                warning_text.warning(f"Attempt {attempt + 1}: Unexpected data format received.")
-                if attempt < max_retries - 1:
-                    time.sleep(2)  # Wait before retrying
-                    warning_text.empty()
-                    continue
-                st.error("Failed to get proper data format after all attempts.")
-                return pd.DataFrame()
-                
-            return data['Close']
-            
-        except Exception as e:
-            warning_text = st.empty()
-            if attempt < max_retries - 1:
-                warning_text.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                time.sleep(2)  # Wait before retrying
-                warning_text.empty()
-                continue
-            st.error(f"Error downloading data after {max_retries} attempts: {str(e)}")
-            return pd.DataFrame()
-            
-    return pd.DataFrame()  # Return empty DataFrame if all attempts fail
-
-def simulate_portfolio(stock_prices: pd.DataFrame, contribution: float, initial_investment: float) -> pd.DataFrame:
-    """Simulates portfolio growth over time for a multi-stock portfolio."""
-    periods = stock_prices.index
-    num_tickers = len(stock_prices.columns)
-    # The contribution per period is split equally among stocks.
-    period_contribution = contribution / num_tickers
-    shares_bought: Dict[str, np.ndarray] = {ticker: np.zeros(len(stock_prices)) for ticker in stock_prices.columns}
-    leftover_cash: Dict[str, float] = {ticker: 0.0 for ticker in stock_prices.columns}
-    initial_per_stock = initial_investment / num_tickers
-
-    # At the first period, buy as many whole shares as possible.
-    for ticker in stock_prices.columns:
-        initial_shares = initial_per_stock // stock_prices[ticker].iloc[0]
-        leftover_cash[ticker] = initial_per_stock % stock_prices[ticker].iloc[0]
-        shares_bought[ticker][0] = initial_shares
-
-    portfolio_values = []
-    for i in range(1, len(periods)):
-        portfolio_value = 0.0
-        for ticker in stock_prices.columns:
-            price = stock_prices[ticker].iloc[i]
-            total_money = period_contribution + leftover_cash[ticker]
-            shares_to_buy = total_money // price
-            leftover_cash[ticker] = total_money % price
-            shares_bought[ticker][i] = shares_bought[ticker][i - 1] + shares_to_buy
-            portfolio_value += shares_bought[ticker][i] * price
-        portfolio_values.append(portfolio_value)
-    return pd.DataFrame({'Portfolio Value': portfolio_values}, index=periods[1:])
-
-def simulate_index_investment(index_prices: pd.Series, contribution: float, initial_investment: float) -> pd.DataFrame:
-    """Simulates index investment growth over time."""
-    periods = index_prices.index
-    period_contribution = contribution
-    shares_bought = np.zeros(len(index_prices))
-    leftover_cash = 0.0
-
-    initial_shares = initial_investment // index_prices.iloc[0]
-    leftover_cash = initial_investment % index_prices.iloc[0]
-    shares_bought[0] = initial_shares
-    portfolio_values = []
-    for i in range(1, len(periods)):
-        price = index_prices.iloc[i]
-        total_money = period_contribution + leftover_cash
-        shares_to_buy = total_money // price
-        leftover_cash = total_money % price
-        shares_bought[i] = shares_bought[i - 1] + shares_to_buy
-        portfolio_values.append(shares_bought[i] * price)
-    return pd.DataFrame({'Index Value': portfolio_values}, index=periods[1:])
+@st.cache_resource
+def get_ticker_cache() -> TickerCache:
+    """Known-valid and known-invalid tickers, shared by every session."""
+    return TickerCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'tickers.db'))
+
+@st.cache_resource
+def get_price_cache() -> PriceCache:
+    """Per-ticker price history shared by every session; any sub-range or subset is served from it."""
+    return PriceCache()
+
+def download_data(tickers: Union[str, List[str]], start: datetime, end: datetime, interval: str, max_retries: int = 3,
+                  progress=None) -> pd.DataFrame:
+    """Gets stock data from the price cache, downloading from Yahoo Finance only the dates it doesn't cover."""
+    # Validate the whole basket in one batched round trip, once rather than on every attempt
+    symbols = [ticker.strip() for ticker in tickers] if isinstance(tickers, list) else [tickers]
+    valid_tickers, invalid_tickers = validate_tickers(symbols, get_ticker_cache())
+    if not valid_tickers:
+        st.error("No valid tickers provided." if isinstance(tickers, list) else f"Invalid ticker: {tickers}")
+        return pd.DataFrame()
+    if invalid_tickers:
+        st.warning(f"Invalid ticker(s): {', '.join(invalid_tickers)}. Skipping...")
+
+    # The download and its retry waits run on worker threads; this thread only relays progress,
+    # into the caller's placeholder when one is given
+    progress_msg = progress if progress is not None else st.empty()
+    close, failures = run_in_background(load_close, valid_tickers, start, end, interval, get_price_cache(),
+                                        max_retries=max_retries, on_message=progress_msg.text)
+    if progress is None:
+        progress_msg.empty()
+
+    if close.empty:
+        st.error(f"Failed to get data after {max_retries} attempts: {'; '.join(sorted(set(failures.values())))}")
+        return pd.DataFrame()
+    if failures:
+        st.warning(f"No data for {', '.join(failures)} after {max_retries} attempts. Skipping...")
+    # A single ticker comes back as a Series, as the simulations expect
+    return close if isinstance(tickers, list) else close[tickers]
 
 # Streamlit App Configuration
 st.set_page_config(
@@ -219,10 +124,10 @@ with st.spinner('Validating tickers and fetching data...'):
     progress_text = st.empty()
     
     progress_text.text("Downloading stock data...")
-    stock_prices = download_data(tickers, start_date, end_date, interval)
+    stock_prices = download_data(tickers, start_date, end_date, interval, progress=progress_text)
     
     progress_text.text("Downloading index data...")
-    index_prices = download_data(index_ticker, start_date, end_date, interval)
+    index_prices = download_data(index_ticker, start_date, end_date, interval, progress=progress_text)
     
     if stock_prices.empty or index_prices.empty:
         st.error("Unable to proceed due to data download issues.")
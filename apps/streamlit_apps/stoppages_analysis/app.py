@@ -6,6 +6,11 @@ import plotly.graph_objects as go
 from datetime import datetime
 from PIL import Image
 
+from stoppage_data import (
+    TIMELINE_DENSITY_ROWS, TIMELINE_DETAIL_ROWS, StoppageIndex, StoppageStore, build_cube, daily_stopped_hours,
+    merge_intervals, rollup
+)
+
 # Load favicon
 try:
     favicon_path = os.path.join(os.path.dirname(__file__), "assets", "favicon.ico")
@@ -31,23 +36,39 @@ except Exception as e:
 st.title("Capitol Cement Plant - Stoppages Analysis")
 st.markdown("---")
 
-# File upload
-uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
-
-if uploaded_file is not None:
+@st.cache_resource
+def get_store() -> StoppageStore:
+    """Parquet history of every uploaded stoppage export, shared by every session."""
+    return StoppageStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'stoppages'))
+
+store = get_store()
+
+# File upload; each export is added to the stored history once
+uploaded_files = st.file_uploader("Add stoppage exports (CSV)", type="csv", accept_multiple_files=True)
+imported_files = st.session_state.setdefault('imported_files', set())
+for uploaded_file in uploaded_files or []:
+    if uploaded_file.file_id in imported_files:
+        continue
+    with st.spinner(f"Importing {uploaded_file.name}..."):
+        added = store.add_export(uploaded_file.getvalue(), uploaded_file.name)
+    imported_files.add(uploaded_file.file_id)
+    if added is None:
+        st.toast(f"{uploaded_file.name} was already imported.")
+    else:
+        st.toast(f"{uploaded_file.name}: {added:,} new stoppages added.")
+
+if store.has_data():
     # Load data
-    @st.cache_data
-    def load_data(file):
-        df = pd.read_csv(file)
-        # Convert duration to hours
-        df['DurationAsHours'] = pd.to_numeric(df['DurationAsHours'], errors='coerce')
-        # Convert datetime columns
-        datetime_cols = ['StopDateTime', 'StartDateTime', 'ClosedDateTime']
-        for col in datetime_cols:
-            df[col] = pd.to_datetime(df[col], format='%d-%m-%Y %H:%M:%S', errors='coerce')
-        return df
-
-    df = load_data(uploaded_file)
+    # Shared rather than copied per rerun; rebuilt only when an import changes the stored history
+    @st.cache_resource(max_entries=2)
+    def load_data(version):
+        # Stored stoppages come back typed like a fresh parse: categorical names, datetimes and hours
+        df = store.load()
+        # Rows back the filters, timeline and detail table; the cube backs every KPI and aggregate chart
+        return StoppageIndex(df), StoppageIndex(build_cube(df), time_col='Day')
+
+    stoppages, cube = load_data(store.get_version())
+    df = stoppages.frame
     
     # Get date range for subtitle
     min_date = df['StopDateTime'].min().strftime('%B %Y')
@@ -60,13 +81,6 @@ if uploaded_file is not None:
     # Sidebar filters
     st.sidebar.header("Filters")
 
-    # Clean and prepare filter data
-    df['CategoryName'] = df['CategoryName'].fillna('Uncategorized')
-    df['AreaName'] = df['AreaName'].fillna('Unknown Area')
-    df['DepartmentName'] = df['DepartmentName'].fillna('Unknown Department')
-    df['EquipmentName'] = df['EquipmentName'].fillna('Unknown Equipment')
-    df['ResponsibleDepartment'] = df['ResponsibleDepartment'].fillna('Unknown Responsible Dept')
-
     # Date range filter
     st.sidebar.subheader("Date Range Filter")
     min_date = df['StopDateTime'].min().date()
@@ -75,66 +89,85 @@ if uploaded_file is not None:
     start_date = st.sidebar.date_input("Start Date", min_date, min_value=min_date, max_value=max_date)
     end_date = st.sidebar.date_input("End Date", max_date, min_value=min_date, max_value=max_date)
 
-    # Filter by date range
-    mask = (df['StopDateTime'].dt.date >= start_date) & (df['StopDateTime'].dt.date <= end_date)
-    df = df[mask]
+    # Filter by date range: a binary search over the sorted stop times
+    lo, hi = stoppages.date_slice(start_date, end_date)
 
     # Sidebar filters
     st.sidebar.subheader("Filter Stoppages")
 
+    # Area -> Department -> Equipment cascade: each level lists only what sits under the selections above it
+    area_counts = stoppages.hierarchy_options('AreaName', lo, hi)
+    area_filter = st.sidebar.multiselect(
+        "Select Areas",
+        options=area_counts.index.tolist(),
+        default=area_counts.index.tolist(),
+        format_func=lambda name: f"{name} ({area_counts[name]:,})"
+    )
+
     # Department filter
+    dept_counts = stoppages.hierarchy_options('DepartmentName', lo, hi, {'AreaName': area_filter})
     dept_filter = st.sidebar.multiselect(
-    "Select Departments",
-    options=sorted(df['DepartmentName'].unique().tolist()),
-    default=sorted(df['DepartmentName'].unique().tolist())
-)
+        "Select Departments",
+        options=dept_counts.index.tolist(),
+        default=dept_counts.index.tolist(),
+        format_func=lambda name: f"{name} ({dept_counts[name]:,})"
+    )
 
-    # Equipment filter
+    # Equipment filter; empty means every piece of equipment in the selected departments
+    equipment_counts = stoppages.hierarchy_options(
+        'EquipmentName', lo, hi, {'AreaName': area_filter, 'DepartmentName': dept_filter}
+    )
     equipment_filter = st.sidebar.multiselect(
-    "Select Equipment",
-    options=sorted(df['EquipmentName'].unique().tolist()),
-    default=sorted(df['EquipmentName'].unique().tolist())
-)
+        "Select Equipment",
+        options=equipment_counts.index.tolist(),
+        format_func=lambda name: f"{name} ({equipment_counts[name]:,})",
+        placeholder="All equipment in the selected departments"
+    )
 
     # Responsible Department filter
     responsible_dept_filter = st.sidebar.multiselect(
     "Select Responsible Departments",
-    options=sorted(df['ResponsibleDepartment'].unique().tolist()),
-    default=sorted(df['ResponsibleDepartment'].unique().tolist())
+    options=stoppages.options('ResponsibleDepartment', lo, hi),
+    default=stoppages.options('ResponsibleDepartment', lo, hi)
 )
 
     # Category filter
     category_filter = st.sidebar.multiselect(
     "Select Categories",
-    options=sorted(df['CategoryName'].unique().tolist()),
-    default=sorted(df['CategoryName'].unique().tolist())
+    options=stoppages.options('CategoryName', lo, hi),
+    default=stoppages.options('CategoryName', lo, hi)
 )
 
     # Filter data
-    filtered_df = df[
-    (df['DepartmentName'].isin(dept_filter)) &
-    (df['EquipmentName'].isin(equipment_filter)) &
-    (df['ResponsibleDepartment'].isin(responsible_dept_filter)) &
-    (df['CategoryName'].isin(category_filter))
-]
+    selections = {
+        'AreaName': area_filter,
+        'DepartmentName': dept_filter,
+        'ResponsibleDepartment': responsible_dept_filter,
+        'CategoryName': category_filter
+    }
+    if equipment_filter:
+        selections['EquipmentName'] = equipment_filter
+    filtered_df = stoppages.filter(start_date, end_date, selections)
+    filtered_cube = cube.filter(start_date, end_date, selections)
 
     # Create two columns for KPIs
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        total_stoppages = len(filtered_df)
+        total_stoppages = filtered_cube['Stoppages'].sum()
         st.metric("Total Stoppages", total_stoppages)
 
     with col2:
-        total_hours = filtered_df['DurationAsHours'].sum()
+        total_hours = filtered_cube['Hours'].sum()
         st.metric("Total Hours", f"{total_hours:.1f}")
 
     with col3:
-        total_economic_value = filtered_df['EconomicValue'].sum()
+        total_economic_value = filtered_cube['EconomicValue'].sum()
         st.metric("Economic Impact", f"${total_economic_value:,.2f}")
 
     with col4:
-        avg_duration = filtered_df['DurationAsHours'].mean()
+        timed_stoppages = filtered_cube['TimedStoppages'].sum()
+        avg_duration = total_hours / timed_stoppages if timed_stoppages else float('nan')
         st.metric("Avg Duration (Hours)", f"{avg_duration:.1f}")
 
     # Create two columns for charts
@@ -143,30 +176,27 @@ if uploaded_file is not None:
     with col1:
         st.subheader("Stoppages by Department")
         dept_fig = px.bar(
-            filtered_df.groupby('DepartmentName')['DurationAsHours'].sum().reset_index(),
+            rollup(filtered_cube, 'DepartmentName'),
             x='DepartmentName',
-            y='DurationAsHours',
+            y='Hours',
             title='Total Duration by Department',
-            labels={'DepartmentName': 'Department', 'DurationAsHours': 'Duration (Hours)'}
+            labels={'DepartmentName': 'Department', 'Hours': 'Duration (Hours)'}
         )
         st.plotly_chart(dept_fig, use_container_width=True)
 
     with col2:
         st.subheader("Stoppages by Category")
         category_fig = px.pie(
-            filtered_df,
+            rollup(filtered_cube, 'CategoryName'),
             names='CategoryName',
-            values='DurationAsHours',
+            values='Hours',
             title='Distribution of Stoppages by Category'
         )
         st.plotly_chart(category_fig, use_container_width=True)
 
     # Equipment Analysis
     st.subheader("Equipment-wise Stoppages Analysis")
-    equipment_df = filtered_df.groupby('EquipmentName').agg({
-        'DurationAsHours': ['sum', 'count'],
-        'EconomicValue': 'sum'
-    }).reset_index()
+    equipment_df = rollup(filtered_cube, 'EquipmentName')[['EquipmentName', 'Hours', 'TimedStoppages', 'EconomicValue']]
     equipment_df.columns = ['Equipment', 'Total Hours', 'Number of Stoppages', 'Economic Impact']
     equipment_df = equipment_df.sort_values('Total Hours', ascending=False).head(10)
 
@@ -183,21 +213,69 @@ if uploaded_file is not None:
 
     # Timeline of stoppages
     st.subheader("Stoppages Timeline")
-    timeline_fig = px.timeline(
-        filtered_df,
-        x_start='StopDateTime',
-        x_end='StartDateTime',
-        y='DepartmentName',
-        color='CategoryName',
-        title='Stoppages Timeline by Department',
-        labels={'DepartmentName': 'Department', 'CategoryName': 'Category'}
-    )
-    timeline_fig.update_yaxes(categoryorder='category ascending')
-    st.plotly_chart(timeline_fig, use_container_width=True)
+    timeline_df = filtered_df.dropna(subset=['StopDateTime', 'StartDateTime'])
+    if timeline_df.empty:
+        st.info("No stoppages with both a stop and a start time in the current filters.")
+    else:
+        # Zoom window; the level of detail follows how many stoppages fall inside it
+        first_day = timeline_df['StopDateTime'].min().date()
+        last_day = timeline_df['StartDateTime'].max().date()
+        window_start, window_end = first_day, last_day
+        if first_day < last_day:
+            window_start, window_end = st.slider(
+                "Timeline window", min_value=first_day, max_value=last_day, value=(first_day, last_day)
+            )
+        window_lo = pd.Timestamp(window_start)
+        window_hi = pd.Timestamp(window_end) + pd.Timedelta(days=1)
+        window_df = timeline_df[(timeline_df['StopDateTime'] < window_hi) & (timeline_df['StartDateTime'] >= window_lo)]
+
+        if len(window_df) <= TIMELINE_DETAIL_ROWS:
+            st.caption(f"Showing all {len(window_df):,} stoppages.")
+            timeline_fig = px.timeline(
+                window_df,
+                x_start='StopDateTime',
+                x_end='StartDateTime',
+                y='DepartmentName',
+                color='CategoryName',
+                title='Stoppages Timeline by Department',
+                labels={'DepartmentName': 'Department', 'CategoryName': 'Category'}
+            )
+        elif len(window_df) <= TIMELINE_DENSITY_ROWS:
+            merged = merge_intervals(window_df)
+            st.caption(f"{len(window_df):,} stoppages merged into {len(merged):,} periods where they overlap or touch. "
+                       f"Narrow the window to {TIMELINE_DETAIL_ROWS:,} stoppages or fewer for one bar each.")
+            timeline_fig = px.timeline(
+                merged,
+                x_start='Start',
+                x_end='End',
+                y='DepartmentName',
+                hover_data={'Stoppages': True, 'Hours': ':.2f'},
+                title='Stoppage Periods by Department',
+                labels={'DepartmentName': 'Department'}
+            )
+        else:
+            daily = daily_stopped_hours(merge_intervals(window_df))
+            daily = daily[(daily['Day'] >= window_lo) & (daily['Day'] < window_hi)]
+            st.caption(f"{len(window_df):,} stoppages binned into hours stopped per department per day. "
+                       f"Narrow the window to {TIMELINE_DENSITY_ROWS:,} stoppages or fewer for individual periods.")
+            hours = daily.pivot_table(index='DepartmentName', columns='Day', values='Hours',
+                                      aggfunc='sum', fill_value=0, observed=True)
+            timeline_fig = go.Figure(go.Heatmap(
+                z=hours.to_numpy(),
+                x=hours.columns,
+                y=hours.index.astype(str),
+                colorscale='Reds',
+                colorbar=dict(title='Hours'),
+                hovertemplate='%{y}<br>%{x|%b %d, %Y}<br>%{z:.1f} hours stopped<extra></extra>'
+            ))
+            timeline_fig.update_layout(title='Hours Stopped per Day by Department')
+        timeline_fig.update_xaxes(range=[window_lo, window_hi])
+        timeline_fig.update_yaxes(categoryorder='category ascending')
+        st.plotly_chart(timeline_fig, use_container_width=True)
 
     # Top reasons for stoppages
     st.subheader("Top Reasons for Stoppages")
-    reasons_df = filtered_df.groupby('ReasonCode')['DurationAsHours'].agg(['sum', 'count']).reset_index()
+    reasons_df = rollup(filtered_cube, 'ReasonCode')[['ReasonCode', 'Hours', 'TimedStoppages']]
     reasons_df.columns = ['Reason', 'Total Hours', 'Count']
     reasons_df = reasons_df.sort_values('Total Hours', ascending=False).head(10)
 
@@ -0,0 +1,437 @@
+"""
+Loading plant stoppage exports for the Streamlit dashboards.
+
+The CSV is parsed by the multithreaded pyarrow reader with every column type
+declared up front: name columns arrive dictionary-encoded and become pandas
+categoricals, and the timestamp columns are parsed in one vectorized pass with
+the export's day-first format. Missing names are filled by adding a placeholder
+category, so the fill touches the category list and codes instead of every row.
+
+StoppageIndex is built once per upload and answers the sidebar filters without
+rescanning strings: rows are kept in stop-time order so a date range is a binary
+search, and each filter dimension is matched through its category codes. It also
+holds the Area -> Department -> Equipment tree, so each cascading filter lists
+only the values under the selections above it.
+
+The timeline has three levels of detail: one bar per stoppage for small windows,
+overlapping or touching stoppages merged per department, and hours stopped per
+department per day once the window holds too many stoppages to draw.
+
+build_cube materializes sums and counts per day and dimension combination once
+per upload; the KPIs and charts slice it with the same filters as the raw rows
+and roll it up, so they don't rescan individual stoppages.
+
+StoppageStore keeps every export uploaded so far as a Parquet dataset partitioned
+by month. Each file is imported once per content hash, and stoppages already in
+the dataset are skipped, so overlapping exports accumulate into one history.
+
+This file must stay identical in streamlit_apps/stoppages_analysis/ and
+streamlit_apps/stoppages_analysis_capagg/. Each app is built from its own
+directory, so neither can import the other's copy; change both together.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+
+DATETIME_FORMAT = '%d-%m-%Y %H:%M:%S'
+DATETIME_COLUMNS = ['StopDateTime', 'StartDateTime', 'ClosedDateTime']
+NUMERIC_COLUMNS = ['DurationAsHours', 'EconomicValue']
+
+# Name columns and the label shown for stoppages that leave them blank
+NAME_PLACEHOLDERS = {
+    'CategoryName': 'Uncategorized',
+    'AreaName': 'Unknown Area',
+    'DepartmentName': 'Unknown Department',
+    'EquipmentName': 'Unknown Equipment',
+    'ResponsibleDepartment': 'Unknown Responsible Dept',
+}
+
+# Code columns kept as categoricals without a placeholder; blanks stay missing
+CODE_COLUMNS = ['ReasonCode']
+
+# Sidebar filter dimensions, in the order the multiselects appear
+FILTER_COLUMNS = ['AreaName', 'DepartmentName', 'EquipmentName', 'ResponsibleDepartment', 'CategoryName']
+
+# Cascading filter levels, outermost first
+HIERARCHY = ['AreaName', 'DepartmentName', 'EquipmentName']
+
+# Dimensions with at most this many values keep one packed bitmap per value (rows / 8 bytes each);
+# larger ones, like equipment, are matched through a code lookup table instead
+BITMAP_MAX_VALUES = 64
+
+# Cube dimensions besides the day, and the measures summed in each cell; TimedStoppages counts
+# the stoppages with a duration, which is what averages and per-group counts divide by
+CUBE_DIMENSIONS = ['AreaName', 'DepartmentName', 'EquipmentName', 'CategoryName', 'ReasonCode', 'ResponsibleDepartment']
+CUBE_MEASURES = ['Stoppages', 'TimedStoppages', 'Hours', 'EconomicValue']
+
+# A stoppage is the same one across exports when these match; exports without an id
+# column fall back to the equipment and its stop/start times
+STOPPAGE_ID_COLUMN = 'StoppageId'
+DEDUPE_TIME_COLUMNS = ['StopDateTime', 'StartDateTime']
+
+# Dataset partition column; stoppages without a stop time go to UNKNOWN_MONTH
+MONTH_COLUMN = 'Month'
+UNKNOWN_MONTH = 'unknown'
+
+# Timeline level of detail by stoppages in the window: one bar each up to TIMELINE_DETAIL_ROWS,
+# merged intervals up to TIMELINE_DENSITY_ROWS, daily hours stopped beyond that
+TIMELINE_DETAIL_ROWS = 2_000
+TIMELINE_DENSITY_ROWS = 20_000
+
+NS_PER_HOUR = 3_600 * 10**9
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+# Timestamps and numbers are read as text and converted leniently, so a malformed cell
+# becomes NaT/NaN the way errors='coerce' did instead of failing the whole file
+COLUMN_TYPES = {
+    **{col: pa.dictionary(pa.int32(), pa.string()) for col in list(NAME_PLACEHOLDERS) + CODE_COLUMNS},
+    **{col: pa.string() for col in DATETIME_COLUMNS + NUMERIC_COLUMNS},
+}
+
+
+def parse_numeric(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Casts a text column to float64, falling back to pandas coercion when a cell isn't a number."""
+    try:
+        return pc.cast(column, pa.float64())
+    except pa.ArrowInvalid:
+        values = pd.to_numeric(column.to_pandas(), errors='coerce')
+        return pa.chunked_array([pa.array(values, type=pa.float64())])
+
+
+def fill_names(series: pd.Series, placeholder: Optional[str] = None) -> pd.Series:
+    """Sorted categories with blanks mapped to `placeholder`; only the category list and codes change."""
+    series = series.cat.remove_unused_categories()
+    categories = set(series.cat.categories)
+    if placeholder is not None and series.isna().any():
+        categories.add(placeholder)
+    series = series.cat.set_categories(sorted(categories))
+    return series.fillna(placeholder) if placeholder in categories else series
+
+
+def read_stoppages(source: Union[str, BinaryIO]) -> pd.DataFrame:
+    """Parses a stoppage export into typed columns: categorical names, datetimes and floats."""
+    table = pa_csv.read_csv(
+        source,
+        convert_options=pa_csv.ConvertOptions(column_types=COLUMN_TYPES, strings_can_be_null=True)
+    )
+
+    for col in DATETIME_COLUMNS + NUMERIC_COLUMNS:
+        if col not in table.column_names:
+            continue
+        if col in DATETIME_COLUMNS:
+            parsed = pc.strptime(table[col], format=DATETIME_FORMAT, unit='ns', error_is_null=True)
+        else:
+            parsed = parse_numeric(table[col])
+        table = table.set_column(table.column_names.index(col), col, parsed)
+
+    df = table.to_pandas()
+    for col, placeholder in {**NAME_PLACEHOLDERS, **dict.fromkeys(CODE_COLUMNS)}.items():
+        if col in df.columns:
+            df[col] = fill_names(df[col], placeholder)
+    return df
+
+
+def merge_intervals(df: pd.DataFrame, group_col: str = 'DepartmentName',
+                    start_col: str = 'StopDateTime', end_col: str = 'StartDateTime') -> pd.DataFrame:
+    """
+    Unions overlapping or touching stoppages within each group in one sorted sweep.
+
+    Rows are ordered by group and start; a new interval opens wherever the group
+    changes or a stoppage starts after the latest end seen so far in its group.
+    Returns one row per merged interval with its Start, End, number of Stoppages
+    and Hours (the length of the union, so overlaps aren't counted twice).
+    """
+    intervals = df[[group_col, start_col, end_col]].dropna()
+    categories = intervals[group_col].cat.categories
+    if intervals.empty:
+        return pd.DataFrame({group_col: pd.Categorical([], categories=categories),
+                             'Start': pd.Series(dtype='datetime64[ns]'), 'End': pd.Series(dtype='datetime64[ns]'),
+                             'Stoppages': pd.Series(dtype=np.int64), 'Hours': pd.Series(dtype=float)})
+
+    starts = intervals[start_col].to_numpy('datetime64[ns]').view('int64')
+    ends = np.maximum(intervals[end_col].to_numpy('datetime64[ns]').view('int64'), starts)
+    groups = intervals[group_col].cat.codes.to_numpy()
+    order = np.lexsort((starts, groups))
+    starts, ends, groups = starts[order], ends[order], groups[order]
+
+    reach = pd.Series(ends).groupby(groups).cummax().to_numpy()
+    opens = np.ones(len(starts), dtype=bool)
+    opens[1:] = (groups[1:] != groups[:-1]) | (starts[1:] > reach[:-1])
+    first = np.flatnonzero(opens)
+    merged_starts = starts[first]
+    merged_ends = np.maximum.reduceat(ends, first)
+
+    return pd.DataFrame({
+        group_col: pd.Categorical.from_codes(groups[first], categories=categories),
+        'Start': merged_starts.view('datetime64[ns]'),
+        'End': merged_ends.view('datetime64[ns]'),
+        'Stoppages': np.diff(np.append(first, len(starts))),
+        'Hours': (merged_ends - merged_starts) / NS_PER_HOUR,
+    })
+
+
+def daily_stopped_hours(merged: pd.DataFrame, group_col: str = 'DepartmentName') -> pd.DataFrame:
+    """
+    Hours stopped per group per calendar day from merge_intervals output.
+
+    Intervals that cross midnight are split so each day gets only its own share.
+    """
+    starts = merged['Start'].to_numpy('datetime64[ns]').view('int64')
+    ends = merged['End'].to_numpy('datetime64[ns]').view('int64')
+    first_day = starts // NS_PER_DAY
+    days_spanned = np.maximum((ends - 1) // NS_PER_DAY - first_day + 1, 1)
+
+    # One piece per (interval, day it touches)
+    pieces = np.repeat(np.arange(len(merged)), days_spanned)
+    offsets = np.arange(len(pieces)) - np.repeat(np.cumsum(days_spanned) - days_spanned, days_spanned)
+    day = (first_day[pieces] + offsets) * NS_PER_DAY
+    hours = (np.minimum(ends[pieces], day + NS_PER_DAY) - np.maximum(starts[pieces], day)) / NS_PER_HOUR
+
+    daily = pd.DataFrame({
+        group_col: merged[group_col].to_numpy()[pieces],
+        'Day': day.view('datetime64[ns]'),
+        'Hours': hours,
+    })
+    return daily.groupby([group_col, 'Day'], observed=True, as_index=False)['Hours'].sum()
+
+
+def build_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Stoppage measures per Day and CUBE_DIMENSIONS combination, one row per non-empty cell.
+
+    Stoppages without a stop time can't match a date range and are left out.
+    Missing reason codes form their own cells so totals still add up.
+    """
+    stops = df.dropna(subset=['StopDateTime'])
+    keys = [stops['StopDateTime'].dt.normalize().rename('Day')] + [stops[col] for col in CUBE_DIMENSIONS]
+    cells = stops.groupby(keys, observed=True, dropna=False, sort=False).agg(
+        Stoppages=('DurationAsHours', 'size'),
+        TimedStoppages=('DurationAsHours', 'count'),
+        Hours=('DurationAsHours', 'sum'),
+        EconomicValue=('EconomicValue', 'sum'),
+    )
+    return cells.reset_index()
+
+
+def rollup(cells: pd.DataFrame, by: Union[str, List[str]]) -> pd.DataFrame:
+    """Sums the cube measures over every dimension not in `by`; skips missing `by` values like a groupby."""
+    return cells.groupby(by, observed=True)[CUBE_MEASURES].sum().reset_index()
+
+
+class StoppageIndex:
+    """
+    Rows sorted by `time_col` with per-dimension codes and bitmaps for the sidebar filters.
+
+    Built over the raw stoppages (time_col='StopDateTime') and over the cube (time_col='Day').
+    """
+
+    def __init__(self, df: pd.DataFrame, time_col: str = 'StopDateTime'):
+        # Rows without a time sort last and never match a date range
+        self.frame = df.sort_values(time_col, kind='stable', na_position='last').reset_index(drop=True)
+        times = self.frame[time_col]
+        self.times = times.to_numpy('datetime64[ns]')[:int(times.notna().sum())].view('int64')
+
+        self.categories = {}
+        self.codes = {}
+        self.bitmaps = {}
+        for col in FILTER_COLUMNS:
+            self.categories[col] = self.frame[col].cat.categories
+            self.codes[col] = self.frame[col].cat.codes.to_numpy()
+            if 0 < len(self.categories[col]) <= BITMAP_MAX_VALUES:
+                self.bitmaps[col] = np.stack([
+                    np.packbits(self.codes[col] == code) for code in range(len(self.categories[col]))
+                ])
+
+        # Tree nodes are the distinct (area, department, equipment) code triples; each row points at its node
+        key = np.zeros(len(self.frame), dtype=np.int64)
+        for col in HIERARCHY:
+            key = key * len(self.categories[col]) + self.codes[col]
+        node_keys, self.node_of_row = np.unique(key, return_inverse=True)
+        self.tree = np.empty((len(node_keys), len(HIERARCHY)), dtype=np.int64)
+        for level in reversed(range(len(HIERARCHY))):
+            size = len(self.categories[HIERARCHY[level]])
+            self.tree[:, level] = node_keys % size
+            node_keys = node_keys // size
+
+    def date_slice(self, start_date, end_date) -> Tuple[int, int]:
+        """Row positions [lo, hi) timed on start_date through end_date, inclusive."""
+        lo = pd.Timestamp(start_date).normalize().value
+        hi = (pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)).value
+        return (int(np.searchsorted(self.times, lo, side='left')),
+                int(np.searchsorted(self.times, hi, side='left')))
+
+    def options(self, col: str, lo: int, hi: int) -> List[str]:
+        """Sorted values of `col` that occur in rows [lo, hi)."""
+        counts = np.bincount(self.codes[col][lo:hi], minlength=len(self.categories[col]))
+        return self.categories[col][counts > 0].tolist()
+
+    def hierarchy_options(self, col: str, lo: int, hi: int,
+                          parents: Optional[Dict[str, Iterable[str]]] = None) -> pd.Series:
+        """
+        Stoppage counts in rows [lo, hi) for each value of a HIERARCHY level, by name.
+
+        `parents` maps the levels above `col` to their selections; only values
+        under those selections are listed.
+        """
+        node_counts = np.bincount(self.node_of_row[lo:hi], minlength=len(self.tree))
+        keep = node_counts > 0
+        for parent, selected in (parents or {}).items():
+            keep &= self.selection(parent, selected)[self.tree[:, HIERARCHY.index(parent)]]
+
+        categories = self.categories[col]
+        counts = np.bincount(self.tree[keep, HIERARCHY.index(col)], weights=node_counts[keep],
+                             minlength=len(categories)).astype(np.int64)
+        return pd.Series(counts[counts > 0], index=categories[counts > 0])
+
+    def selection(self, col: str, selected: Iterable[str]) -> np.ndarray:
+        """Boolean lookup over the categories of `col`, True for the selected values."""
+        chosen = np.zeros(len(self.categories[col]), dtype=bool)
+        codes = self.categories[col].get_indexer(list(selected))
+        chosen[codes[codes >= 0]] = True
+        return chosen
+
+    def value_mask(self, col: str, selected: Iterable[str], lo: int, hi: int) -> Optional[np.ndarray]:
+        """Boolean mask over rows [lo, hi) matching `selected`, or None when every value is selected."""
+        categories = self.categories[col]
+        chosen = self.selection(col, selected)
+        if chosen.all():
+            return None
+
+        if col not in self.bitmaps:
+            return chosen[self.codes[col][lo:hi]]
+
+        # OR together whichever side of the selection has fewer bitmaps
+        invert = chosen.sum() > len(categories) / 2
+        picked = self.bitmaps[col][~chosen if invert else chosen, lo // 8:(hi + 7) // 8]
+        packed = np.bitwise_or.reduce(picked, axis=0) if len(picked) else np.zeros(picked.shape[1], dtype=np.uint8)
+        mask = np.unpackbits(packed)[lo % 8:lo % 8 + hi - lo].astype(bool)
+        return ~mask if invert else mask
+
+    def filter(self, start_date, end_date, selections: Dict[str, Iterable[str]]) -> pd.DataFrame:
+        """Stoppages in the date range whose filter columns take one of the selected values."""
+        lo, hi = self.date_slice(start_date, end_date)
+        mask = None
+        for col, selected in selections.items():
+            col_mask = self.value_mask(col, selected, lo, hi)
+            if col_mask is not None:
+                mask = col_mask if mask is None else mask & col_mask
+        if mask is None:
+            return self.frame.iloc[lo:hi]
+        return self.frame.iloc[lo + np.flatnonzero(mask)]
+
+
+class StoppageStore:
+    """Parquet dataset of every stoppage export uploaded so far, partitioned by month"""
+
+    def __init__(self, root: str = "data/stoppages"):
+        """Create the dataset directory and load the import manifest"""
+        # Create data directory if it doesn't exist
+        self.dataset_dir = Path(root) / "dataset"
+        self.dataset_dir.mkdir(parents=True, exist_ok=True)
+
+        self.manifest_path = Path(root) / "imports.json"
+        self.imports = self.read_manifest()
+        # Sessions share one store; imports are serialized so dedupe sees every earlier write
+        self.lock = threading.Lock()
+
+    def read_manifest(self) -> Dict[str, Dict]:
+        """Imported exports by content hash"""
+        if not self.manifest_path.exists():
+            return {}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_manifest(self):
+        """Write the manifest through a temporary file so a crash never leaves it half-written"""
+        tmp_path = str(self.manifest_path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.imports, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def get_version(self) -> str:
+        """Changes whenever an export is imported, for keying cached views on the dataset contents"""
+        return f"{len(self.imports)}:{sum(entry['rows_added'] for entry in self.imports.values())}"
+
+    def has_data(self) -> bool:
+        """Whether any stoppages have been stored"""
+        return any(entry['rows_added'] for entry in self.imports.values())
+
+    def dataset(self, schema: Optional[pa.Schema] = None) -> ds.Dataset:
+        """The stored stoppages with the month partition read back from the directory names"""
+        return ds.dataset(self.dataset_dir, schema=schema, format='parquet', partitioning='hive')
+
+    def stored_keys(self, months: List[str], key: List[str]) -> pd.DataFrame:
+        """Dedupe keys of the stoppages already stored in `months`"""
+        if not self.has_data():
+            return pd.DataFrame(columns=key)
+        table = self.dataset().to_table(columns=key, filter=ds.field(MONTH_COLUMN).isin(months))
+        return table.to_pandas()
+
+    def add_export(self, data: bytes, name: str = '') -> Optional[int]:
+        """
+        Stores the stoppages in a CSV export that aren't in the dataset yet.
+
+        Returns the number of rows added, or None when this exact file was imported before.
+        """
+        content_hash = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            if content_hash in self.imports:
+                return None
+
+            df = read_stoppages(io.BytesIO(data))
+            rows = len(df)
+            key = [STOPPAGE_ID_COLUMN if STOPPAGE_ID_COLUMN in df.columns else 'EquipmentName'] + DEDUPE_TIME_COLUMNS
+            df = df.drop_duplicates(subset=key)
+            df[MONTH_COLUMN] = df['StopDateTime'].dt.strftime('%Y-%m').fillna(UNKNOWN_MONTH).astype(object)
+
+            # Anti-join against what the touched months already hold
+            stored = self.stored_keys(df[MONTH_COLUMN].unique().tolist(), key)
+            if len(stored):
+                seen = df[key].merge(stored.drop_duplicates(), how='left', indicator=True)
+                df = df[(seen['_merge'] == 'left_only').to_numpy()]
+
+            if len(df):
+                ds.write_dataset(
+                    pa.Table.from_pandas(df, preserve_index=False),
+                    self.dataset_dir,
+                    format='parquet',
+                    partitioning=ds.partitioning(pa.schema([(MONTH_COLUMN, pa.string())]), flavor='hive'),
+                    basename_template=f'{content_hash[:16]}-{{i}}.parquet',
+                    existing_data_behavior='overwrite_or_ignore'
+                )
+
+            self.imports[content_hash] = {
+                'name': name,
+                'rows': rows,
+                'rows_added': int(len(df)),
+                'imported_at': datetime.now().isoformat(timespec='seconds'),
+            }
+            self.write_manifest()
+        return len(df)
+
+    def load(self) -> pd.DataFrame:
+        """Every stored stoppage, typed like read_stoppages output"""
+        with self.lock:
+            fragments = list(self.dataset().get_fragments())
+            if not fragments:
+                return pd.DataFrame()
+            # Exports can disagree on inferred types (an all-blank column reads as null), so widen to a common schema
+            schema = pa.unify_schemas([fragment.physical_schema for fragment in fragments], promote_options='permissive')
+            table = self.dataset(schema).to_table()
+        df = table.to_pandas()
+        for col, placeholder in {**NAME_PLACEHOLDERS, **dict.fromkeys(CODE_COLUMNS)}.items():
+            if col in df.columns:
+                df[col] = fill_names(df[col].astype('category'), placeholder)
+        return df